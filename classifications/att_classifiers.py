@@ -13,82 +13,110 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from sklearn.svm import SVC
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.ensemble import AdaBoostClassifier
-from sklearn.neighbors import KNeighborsClassifier
-
 from helper_classes import Feature_Preprocessor
+from feature_extraction.profiling import stage
+
+class SVM_Ranker:
+    """
+        A probabilistic SVM fitted once on _features_, that ranks the authors for any number of unknown texts.
+    """
+    def __init__(self, features, classes):
+        from sklearn.svm import SVC
+
+        self.FP = Feature_Preprocessor(features, True, False, 30)
+        features = self.FP.batch_normalize(features)
+
+        self.clf = SVC(probability=True, kernel='rbf', C=2.4, degree=1, gamma=0.7/len(features[0]))
+        with stage("svm_rank.fit"):
+            self.clf.fit(features, classes)
+
+    def scores(self, unknown):
+        """
+            Log probabilities of every author (in the order of self.clf.classes_) for each unknown text
+        """
+        with stage("svm_rank.predict"):
+            return self.clf.predict_log_proba(self.FP.batch_normalize(unknown))
+
+    def rank(self, unknown, actual_classes):
+        """
+            The rank of the actual author of each unknown text, 0 is the most likely author
+        """
+        from metrics import ranks_from_scores
+        return ranks_from_scores(self.scores(unknown), self.clf.classes_, actual_classes).tolist()
 
 def SVM_predict_rank(features, classes, unknown, actual_classes):
     """
         Proviced a ranking of the different authors by likelyhood of having authored each unknown text.
     """
-    FP = Feature_Preprocessor(features, True, False, 30)
-    features = FP.batch_normalize(features)
-    unknown = FP.batch_normalize(unknown)
-
-    clf = SVC(probability=True, kernel='rbf', C=2.4, degree=1, gamma=0.7/len(features[0]))
-    clf.fit(features, classes)
-
-    # I'm sorry about the following lines:
-    predictions = map(lambda x : zip(clf.classes_, x), clf.predict_log_proba(unknown))
-    orderings = zip(map(lambda x : sorted(x, key = lambda s : s[1], reverse=True), predictions), actual_classes)
-
-    orderings = [([ e[0] for e in l[0] ], l[1]) for l in orderings]
-    rankings = map(lambda x : x[0].index(x[1]), orderings )
+    return SVM_Ranker(features, classes).rank(unknown, actual_classes)
+
+def SVM_classifier(features):
+    from sklearn.svm import SVC
+    return SVC(kernel='rbf', C=2.4, degree=1, gamma=0.7/len(features[0]))
+
+def KNeighborsClassifier_classifier(features):
+    from sklearn.neighbors import KNeighborsClassifier
+    return KNeighborsClassifier(n_neighbors=4,  weights='distance', algorithm='brute', metric='minkowski', p=1)
+
+def DecisionTreeClassifier_classifier(features):
+    from sklearn.tree import DecisionTreeClassifier
+    return DecisionTreeClassifier(criterion='entropy', min_samples_split=2, splitter='best')
+
+def AdaBoostClassifier_classifier(features):
+    from sklearn.ensemble import AdaBoostClassifier
+    return AdaBoostClassifier(n_estimators=10, learning_rate=0.998, algorithm='SAMME.R', random_state=1)
+
+# For each method: the Feature_Preprocessor parameters (centralize, pca, components),
+#   and the function that makes the (unfitted) classifier from the normalized training features.
+# Methods with the same preprocessing can share the normalized features, see att_classify.cross_validate_methods
+CLASSIFIERS = {
+    'svm': ((True, False, 30), SVM_classifier),
+    'knn': ((True, False, 30), KNeighborsClassifier_classifier),
+    'decision_tree': ((True, True, 30), DecisionTreeClassifier_classifier),
+    'adaboost': ((True, False, 30), AdaBoostClassifier_classifier),
+}
+
+def fit_predict(name, features, classes, unknown):
+    """
+        Fits classifier _name_ on already normalized _features_, returns its predictions for _unknown_
+    """
+    clf = CLASSIFIERS[name][1](features)
+    with stage(name + ".fit"):
+        clf.fit(features, classes)
 
-    return rankings
+    with stage(name + ".predict"):
+        return clf.predict(unknown)
 
-def SVM_predict(features, classes, unknown):
+def predict(name, features, classes, unknown):
     """
-        Provices the most likely author for each unknown text
+        Normalizes the features as method _name_ wants them, then fits and predicts.
     """
-    FP = Feature_Preprocessor(features, True, False, 30)
+    FP = Feature_Preprocessor(features, *CLASSIFIERS[name][0])
     features = FP.batch_normalize(features)
     unknown = FP.batch_normalize(unknown)
 
-    clf = SVC(kernel='rbf', C=2.4, degree=1, gamma=0.7/len(features[0]))
-    clf.fit(features, classes)
+    return fit_predict(name, features, classes, unknown)
 
-    return clf.predict(unknown)
+def SVM_predict(features, classes, unknown):
+    """
+        Provices the most likely author for each unknown text
+    """
+    return predict('svm', features, classes, unknown)
 
 def KNeighborsClassifier_predict(features, classes, unknown):
     """
         Provices the most likely author for each unknown text
     """
-    FP = Feature_Preprocessor(features, True, False, 30)
-    features = FP.batch_normalize(features)
-    unknown = FP.batch_normalize(unknown)
-
-    clf = KNeighborsClassifier(n_neighbors=4,  weights='distance', algorithm='brute', metric='minkowski', p=1)
-    clf.fit(features, classes)
-
-    return clf.predict(unknown)
+    return predict('knn', features, classes, unknown)
 
 def DecisionTreeClassifier_predict(features, classes, unknown):
     """
         Provices the most likely author for each unknown text
     """
-    FP = Feature_Preprocessor(features, True, True, 30)
-    features = FP.batch_normalize(features)
-    unknown = FP.batch_normalize(unknown)
-
-    clf = DecisionTreeClassifier(criterion='entropy', min_samples_split=2, splitter='best')
-    clf.fit(features, classes)
-
-    return clf.predict(unknown)
+    return predict('decision_tree', features, classes, unknown)
 
 def AdaBoostClassifier_predict(features, classes, unknown):
     """
         Provices the most likely author for each unknown text
     """
-    FP = Feature_Preprocessor(features, True, False, 30)
-    features = FP.batch_normalize(features)
-    unknown = FP.batch_normalize(unknown)
-
-    clf = AdaBoostClassifier(n_estimators=10, learning_rate=0.998, algorithm='SAMME.R', random_state=1)
-    clf.fit(features, classes)
-
-    return clf.predict(unknown)
-
+    return predict('adaboost', features, classes, unknown)
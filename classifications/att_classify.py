@@ -13,86 +13,27 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from random import sample, seed, shuffle
-
+from helper_classes import Feature_Preprocessor
+from splits import Natural_Splits, Attack_Splits, name_has_substring
 from att_classifiers import *
 
 
-def name_has_substring(name, substrings):
-    """
-        Checks if a name contains one of many substrings
-    """
-    for elem in substrings:
-        if elem in name:
-            return True
-    return False
-
-
 def create_splits_attack(data, num_authors=40, samples=1, exclude=['verification', 'imitation'], attack=['obfuscation']):
     """
        Splits the data into learn-test sets.
        Seed is set to have identical results on different runs.
+       See splits.Attack_Splits for lazy and parallel-safe splits.
     """
-    sets = []
-    seed(1)
-    for authorset in [ sample(sorted(data.keys()), num_authors) for _ in xrange(samples) ]:
-        inset_f = []
-        inset_c = []
-        outset_f = []
-        outset_c = []
-        for author in authorset:
-            for story in data[author].keys():
-                if not name_has_substring(story, exclude):
-                    if name_has_substring(story, attack):
-                        outset_f.append(data[author][story])
-                        outset_c.append(author)
-                    else:
-                        inset_f.append(data[author][story])
-                        inset_c.append(author)
-        sets.append(((inset_f, inset_c),(outset_f, outset_c)))
-
-    return sets
+    return Attack_Splits(data, num_authors, samples, exclude, attack, compat=True).sets(data)
 
 
 def create_splits(data, samples=2, num_authors=40, splits_per_sample=1, exclude=['verification', 'imitation', 'obfuscation']):
     """
         Splits the data into learn-test sets.
         A seed is set for randomization, and items are sorted, so as to give same results on different runs and on different systems
+        See splits.Natural_Splits for lazy and parallel-safe splits.
     """
-    seed(1)
-
-    # Get a clean data set of only natural writing styles
-    clean_stories = dict()
-    for author in data.keys():
-        author_stories = filter(lambda x : not name_has_substring(x, exclude), data[author].keys())
-        clean_stories[author] = dict([ (k, data[author][k]) for k in author_stories])
-
-    assert min([len(x) for x in clean_stories.values()]) >= splits_per_sample, "More splits per sample than there are samples"
-
-    # A data dictionary with the stories for each author sorted so that we have same order (and same results) on different operating systems
-    author_to_storylist = dict( [(a, sorted(clean_stories[a].keys())) for a in clean_stories.keys()] )
-    sets = []
-
-    for subset in [ sample(sorted(clean_stories.keys()), num_authors) for _ in xrange(samples) ]:
-        subset = dict([ (k, clean_stories[k]) for k in subset ])
-        [ shuffle(author_to_storylist[k]) for k in author_to_storylist.keys() ]
-        for index in xrange(splits_per_sample):
-            inset_f = []
-            inset_c = []
-            outset_f = []
-            outset_c = []
-            for author in subset:
-                for i in xrange(len(author_to_storylist[author])):
-                    if i == index:
-                        outset_f.append(subset[author][author_to_storylist[author][i]])
-                        outset_c.append(author)
-                    else:
-                        inset_f.append(subset[author][author_to_storylist[author][i]])
-                        inset_c.append(author)
-
-            sets.append(((inset_f, inset_c),(outset_f, outset_c)))
-
-    return sets
+    return Natural_Splits(data, samples, num_authors, splits_per_sample, exclude, compat=True).sets(data)
 
 
 def cross_validate(sets, method, verbose=True):
@@ -117,6 +58,43 @@ def cross_validate(sets, method, verbose=True):
     return p, c
 
 
+def evaluate_fold(((inset_f, inset_c), (outset_f, outset_c)), names):
+    """
+        Fits all methods in _names_ on one fold. Methods with the same preprocessing share the normalized features.
+        Returns the predictions per method.
+    """
+    groups = dict()
+    for name in names:
+        groups.setdefault(CLASSIFIERS[name][0], []).append(name)
+
+    predictions = dict()
+    for params, group in groups.items():
+        FP = Feature_Preprocessor(inset_f, *params)
+        features = FP.batch_normalize(inset_f)
+        unknown = FP.batch_normalize(outset_f)
+        for name in group:
+            predictions[name] = list(fit_predict(name, features, inset_c, unknown))
+    return predictions
+
+
+def cross_validate_methods(sets, names):
+    """
+        Like cross_validate, but for several methods (keys of att_classifiers.CLASSIFIERS) at once.
+        Each fold is normalized once per distinct preprocessing, and all methods are fitted on that.
+        For folds in parallel processes see shared_dataset.cross_validate_shared,
+            which sends the workers row indexes instead of the features of every fold.
+        Returns a dictionary from method name to (predictions, classes).
+    """
+    fold_predictions = [ evaluate_fold(s, names) for s in sets ]
+
+    results = dict([ (name, ([], [])) for name in names ])
+    for s, predictions in zip(sets, fold_predictions):
+        for name in names:
+            results[name][0].extend(predictions[name])
+            results[name][1].extend(s[1][1])
+    return results
+
+
 def data_select_specific_features(data, features=False):
     """
         Selects specific features from a data set and returns data set in similar structure.
@@ -140,14 +118,9 @@ def get_precision_at_rank(sets, method=SVM_predict_rank):
     """
         Returns the precision at all ranks for sets
     """
+    from metrics import precision_at_ranks
     print "Determining precision at rank."
 
-    def precisions_at_ranks(ranks, setsize):
-        precisions = []
-        for i in xrange(setsize):
-            precisions.append( sum([ r <= i for r in ranks ])/float(len(ranks)) )
-        return precisions
-
     def cross_validate(sets, method):
         def get_score(method, (inset_f, inset_c),(outset_f, outset_c)):
             return method(inset_f, inset_c, outset_f, outset_c)
@@ -158,13 +131,15 @@ def get_precision_at_rank(sets, method=SVM_predict_rank):
         return rankings
 
     rankings = cross_validate(sets, method)
-    precisions = precisions_at_ranks(rankings, len(set(sets[0][0][1])))
+    precisions = precision_at_ranks(rankings, len(set(sets[0][0][1])))
     print precisions
+    return precisions
 
 
 if __name__ == '__main__':
     print "Loading data.."
-    from feature_extraction.Cached_Features import data
+    from feature_extraction.feature_store import load_features
+    data = load_features()
     print "Working..."
 
     features = ['mono_char_dist', 'mono_chunk_dist', 'bi_tag_dist', 'word_length', 'legomena', 'bi_char_dist', 'readability', 'mono_tag_dist']
@@ -176,4 +151,8 @@ if __name__ == '__main__':
     else:
         sets = create_splits(selected_data, samples=10, num_authors=10, splits_per_sample=2)
 
-    print get_precision_at_rank(sets)
\ No newline at end of file
+    get_precision_at_rank(sets)
+
+    from feature_extraction import profiling
+    if profiling.ENABLED:
+        profiling.report()
@@ -0,0 +1,176 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    Scans a whole blog feature cache for posts that look obfuscated or imitated.
+    The detector (natural vs attack, as de-obf_classify.AdaBoostClassifier_predict_texttype) is trained once on the
+        Drexel/EBG features and saved. The scan loads it once per worker process, streams the feature rows of the cache
+        in chunks and scores each chunk with one vectorized predict_proba.
+    Only the most suspicious posts are kept, in a heap, and written as a ranked report with the throughput.
+"""
+
+import heapq, cPickle
+from collections import deque
+from time import time
+
+from helper_classes import Zscore_Normalizer, blog_feature_chunks
+from feature_extraction.profiling import stage
+
+# The detector of this process, see load_detector
+DETECTOR = None
+
+
+class Attack_Detector:
+    """
+        Z-score normalization (helper_classes.Zscore_Normalizer, applied to whole chunks at once) and an AdaBoost classifier.
+        _features_ are the feature names the detector was trained on (False for all).
+    """
+    def __init__(self, features, classes, feature_names=False):
+        from sklearn.ensemble import AdaBoostClassifier
+
+        self.normalizer = Zscore_Normalizer(features)
+        self.features = feature_names
+
+        self.clf = AdaBoostClassifier(n_estimators=80, learning_rate=0.998, algorithm='SAMME.R', random_state=1)
+        with stage("detector.fit"):
+            self.clf.fit(self.normalize(features), classes)
+
+    def normalize(self, rows):
+        return self.normalizer.normalize(rows)
+
+    def suspicion(self, rows):
+        """
+            The probability that each row is an attack
+        """
+        with stage("detector.predict"):
+            probabilities = self.clf.predict_proba(self.normalize(rows))
+        return probabilities[:, list(self.clf.classes_).index(1)]
+
+    def save(self, filename):
+        f = open(filename, 'wb')
+        cPickle.dump(self, f, cPickle.HIGHEST_PROTOCOL)
+        f.close()
+
+
+def train_detector(data, features=False, interest=['obfuscation', 'imitation'], exclude=['verification']):
+    """
+        Trains an Attack_Detector on cached features (as feature_store.load_features gives them)
+    """
+    from att_classify import data_select_specific_features
+    from obf_visualize_classes import get_feature_vectors_from_data
+
+    vectors, classes = get_feature_vectors_from_data(data_select_specific_features(data, features), interest, exclude)
+    return Attack_Detector(vectors, classes, features)
+
+
+def load_detector(filename):
+    global DETECTOR
+    f = open(filename, 'rb')
+    DETECTOR = cPickle.load(f)
+    f.close()
+    return DETECTOR
+
+
+def score_chunk((keys, rows)):
+    return keys, DETECTOR.suspicion(rows).tolist()
+
+
+class Suspicion_Report:
+    """
+        Keeps the _top_ most suspicious posts, a histogram of all suspicions and the throughput.
+    """
+    def __init__(self, top=1000, bins=10):
+        self.top = top
+        self.heap = []
+        self.histogram = [ 0 for _ in xrange(bins) ]
+        self.rows = 0
+        self.chunks = 0
+        self.start = time()
+
+    def add(self, keys, suspicions):
+        bins = len(self.histogram)
+        for key, p in zip(keys, suspicions):
+            self.histogram[min(int(p * bins), bins - 1)] += 1
+            if len(self.heap) < self.top:
+                heapq.heappush(self.heap, (p, key))
+            elif p > self.heap[0][0]:
+                heapq.heapreplace(self.heap, (p, key))
+        self.rows += len(keys)
+        self.chunks += 1
+
+    def stats(self):
+        seconds = time() - self.start
+        return {
+            'rows': self.rows,
+            'chunks': self.chunks,
+            'seconds': seconds,
+            'rows_per_second': self.rows / seconds if seconds > 0 else 0.0,
+            'histogram': self.histogram,
+        }
+
+    def write(self, filename):
+        f = open(filename, 'w')
+        for key, value in sorted(self.stats().items()):
+            f.write("# %s\t%s\n" % (key, value))
+        f.write("rank\tauthor\tpost\tsuspicion\n")
+        for rank, (p, (author, post)) in enumerate(sorted(self.heap, reverse=True)):
+            f.write("%d\t%s\t%d\t%.6f\n" % (rank + 1, author, post, p))
+        f.close()
+
+
+def scan(cache, detector_file, output="attack_scan.tsv", processes=1, chunk_size=10000, top=1000):
+    """
+        Scores every post in the blog feature cache _cache_ with the detector saved in _detector_file_.
+        At most two chunks per worker are in flight, so memory does not grow with the size of the cache.
+        Returns the statistics of the scan.
+    """
+    detector = load_detector(detector_file)
+    chunks = blog_feature_chunks(cache, detector.features, chunk_size, keys=True)
+    report = Suspicion_Report(top)
+
+    if processes > 1:
+        from multiprocessing import Pool
+        pool = Pool(processes, initializer=load_detector, initargs=(detector_file,))
+        pending = deque()
+        try:
+            for chunk in chunks():
+                pending.append(pool.apply_async(score_chunk, (chunk,)))
+                if len(pending) >= 2 * processes:
+                    report.add(*pending.popleft().get())
+            while pending:
+                report.add(*pending.popleft().get())
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for chunk in chunks():
+            report.add(*score_chunk(chunk))
+
+    report.write(output)
+    stats = report.stats()
+    print "Scanned %d posts in %.1f s (%.0f posts/s)" % (stats['rows'], stats['seconds'], stats['rows_per_second'])
+    return stats
+
+
+if __name__ == '__main__':
+    import os
+    from feature_extraction.feature_store import load_features
+    # Through the module, so the pickled detector refers to attack_scan.Attack_Detector and not to __main__
+    from attack_scan import train_detector, scan
+    here = os.path.dirname(os.path.realpath(__file__))
+    print "Training the detector..."
+    train_detector(load_features()).save("attack_detector.pickle")
+    print "Scanning..."
+    scan(os.path.join(here, "../../cached_blogs.shelve"), "attack_detector.pickle", processes=4)
@@ -0,0 +1,387 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    Reproducible benchmarks over the bundled Drexel-AMT and Brennan-Greenstadt corpora.
+    Run from the repository root:
+        PYTHONPATH=. python classifications/benchmark.py --output results.json --baseline baseline.json
+
+    Results are written as JSON. Metrics ending in _seconds are better when lower,
+        metrics ending in _per_second are better when higher.
+    Every metric that is more than _tolerance_ worse than in the baseline is reported as a regression.
+    The baseline is classifications/benchmark_baseline.json (or the file given with --baseline).
+    Timings only compare on the same machine, so the baseline is made there, from a known good revision:
+        PYTHONPATH=. python classifications/benchmark.py --save-baseline
+    and is made again whenever a change is meant to alter the timings.
+"""
+
+import os, sys, json
+from random import Random
+from time import time
+
+from feature_extraction import profiling
+
+DATA = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../Data/")
+BASELINE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "benchmark_baseline.json")
+CORPORA = ["Drexel-AMT-Corpus", "Brennan-Greenstadt-Corpus"]
+
+
+def corpus_files(corpus, limit=None, seed=1):
+    """
+        Lists the text files of _corpus_ as (author, story, path) triplets.
+        With _limit_ a fixed random selection of that size is made.
+    """
+    folder = os.path.join(DATA, corpus)
+    files = []
+    for author in sorted(os.listdir(folder)):
+        if author.startswith(".") or not os.path.isdir(os.path.join(folder, author)):
+            continue
+        for story in sorted(os.listdir(os.path.join(folder, author))):
+            if not story.startswith(".") and 'demographics' not in story:
+                files.append((author, story, os.path.join(folder, author, story)))
+    if limit is not None and limit < len(files):
+        files = sorted(Random(seed).sample(files, limit))
+    return files
+
+
+def natural_data(data):
+    """
+        The authors of _data_ that have natural texts (a selection of texts, see --limit, may leave some without)
+    """
+    from splits import name_has_substring
+    exclude = ['verification', 'imitation', 'obfuscation']
+    return dict([ (a, d) for a, d in data.items() if [ s for s in d if not name_has_substring(s, exclude) ] ])
+
+
+def timed(function, *args, **kwargs):
+    """
+        Returns the result of the call and the seconds it took
+    """
+    start = time()
+    result = function(*args, **kwargs)
+    return result, time() - start
+
+
+def bench_preprocessing(files):
+    from feature_extraction.create_Datasets import load_file
+
+    docs = dict()
+    words = 0
+    start = time()
+    for author, story, path in files:
+        docs[(author, story)] = load_file(path)
+        words += len(docs[(author, story)][0])
+    seconds = time() - start
+    return docs, {
+        'preprocessing_seconds': seconds,
+        'preprocessing_docs_per_second': len(files) / seconds,
+        'preprocessing_words_per_second': words / seconds,
+    }
+
+
+def bench_tag_mapping(files, repeats=3):
+    """
+        Throughput of mapping Penn treebank tags to universal tags, per token with NLTK's map_tag
+            and in batch with the compiled table of create_Datasets.
+        The texts are tagged once beforehand, so only the mapping is timed.
+    """
+    import io
+    from nltk.tag import map_tag
+    from feature_extraction import create_Datasets
+
+    create_Datasets.load_taggers()
+    sentences = []
+    for author, story, path in files:
+        f = io.open(path, encoding="utf8", errors="replace")
+        text = f.read()
+        f.close()
+        for sentence in create_Datasets.sent_tokenize(text):
+            sentences.append([ t for _, t in create_Datasets.pos_tag(create_Datasets.word_tokenize(sentence)) ])
+    tokens = sum([ len(s) for s in sentences ])
+
+    def per_token():
+        return [ [ map_tag('en-ptb', 'universal', t) for t in s ] for s in sentences ]
+
+    def table():
+        return [ create_Datasets.tag_codes(s) for s in sentences ]
+
+    results = {'tag_mapping_tokens': tokens}
+    for name, function in [('map_tag', per_token), ('table', table)]:
+        best = min([ timed(function)[1] for _ in xrange(repeats) ])
+        results['tag_mapping_%s_tokens_per_second' % name] = tokens / best if best > 0 else 0.0
+    return results
+
+
+def bench_feature_extraction(docs):
+    from feature_extraction.feature_extraction import get_features
+
+    data = dict()
+    start = time()
+    for (author, story), doc in sorted(docs.items()):
+        data.setdefault(author, dict())[story] = get_features(*doc)
+    seconds = time() - start
+    return data, {
+        'feature_extraction_seconds': seconds,
+        'feature_extraction_docs_per_second': len(docs) / seconds,
+    }
+
+
+def bench_preprocessor(data):
+    from helper_classes import Feature_Preprocessor
+
+    matrix = []
+    for author in sorted(data.keys()):
+        for story in sorted(data[author].keys()):
+            matrix.append(data[author][story][0])
+
+    results = dict()
+    for name, pca in [('zscore', False), ('zscore_pca', True)]:
+        FP, seconds = timed(Feature_Preprocessor, matrix, True, pca, 30)
+        results['preprocessor_%s_fit_seconds' % name] = seconds
+        _, seconds = timed(FP.batch_normalize, matrix)
+        results['preprocessor_%s_transform_seconds' % name] = seconds
+    return results
+
+
+def bench_classifiers(sets):
+    """
+        Times the fit and predict steps of each classifier, using the profiling stages.
+    """
+    from att_classify import cross_validate
+    import att_classifiers
+
+    methods = [
+        ('svm', att_classifiers.SVM_predict),
+        ('knn', att_classifiers.KNeighborsClassifier_predict),
+        ('decision_tree', att_classifiers.DecisionTreeClassifier_predict),
+        ('adaboost', att_classifiers.AdaBoostClassifier_predict),
+    ]
+
+    results = dict()
+    was_enabled = profiling.ENABLED
+    profiling.enable()
+    for name, method in methods:
+        profiling.reset()
+        _, seconds = timed(cross_validate, sets, method, False)
+        results['%s_cross_validate_seconds' % name] = seconds
+        for step in ['fit', 'predict']:
+            record = profiling.records.get('%s.%s' % (name, step))
+            if record is not None:
+                results['%s_%s_seconds' % (name, step)] = record['wall'] / record['calls']
+    profiling.reset()
+    profiling.enable(was_enabled)
+    return results
+
+
+def bench_end_to_end(data):
+    from feature_selection import survey
+    from att_classify import get_precision_at_rank, create_splits, data_select_specific_features
+
+    data = natural_data(data)
+    results = dict()
+    _, results['survey_seconds'] = timed(survey, data, num_authors=min(40, len(data)))
+    sets = create_splits(data_select_specific_features(data), samples=2, num_authors=min(10, len(data)), splits_per_sample=1)
+    _, results['precision_at_rank_seconds'] = timed(get_precision_at_rank, sets)
+    return results
+
+
+def bench_read_throughput(data, lookups=1000, seed=1):
+    """
+        Size and read speed of the cached features in each storage format: the python literal,
+            its marshal copy, and block containers (see feature_extraction.block_store) with zlib and bz2.
+        Full reads load everything, their MB/s are of the marshalled data (the same for every format).
+        Random reads fetch _lookups_ single texts from a block container.
+    """
+    import shutil, tempfile, marshal
+    from feature_extraction.feature_store import load_feature_file
+    from feature_extraction.block_store import write_nested, Block_Reader
+
+    folder = tempfile.mkdtemp()
+    try:
+        literal = os.path.join(folder, "features.py")
+        f = open(literal, 'w')
+        f.write("data = " + repr(data) + "\n")
+        f.close()
+        load_feature_file(literal)      # Makes the marshal copy
+        files = [('literal', literal), ('marshal', os.path.join(folder, "features.marshal"))]
+        for codec in ['zlib', 'bz2']:
+            container = os.path.join(folder, "features_%s.blkz" % codec)
+            write_nested(container, data, codec=codec)
+            files.append(('blkz_' + codec, container))
+
+        results = dict()
+        raw = os.path.getsize(files[1][1])
+        for name, filename in files:
+            size = os.path.getsize(filename)
+            if name == 'literal':
+                namespace = dict()
+                _, seconds = timed(execfile, filename, namespace)
+            elif name == 'marshal':
+                f = open(filename, 'rb')
+                _, seconds = timed(marshal.load, f)
+                f.close()
+            else:
+                _, seconds = timed(load_feature_file, filename)
+            results['read_%s_bytes' % name] = size
+            results['read_%s_full_seconds' % name] = seconds
+            results['read_%s_mb_per_second' % name] = raw / 1e6 / seconds if seconds > 0 else 0.0
+
+            if name.startswith('blkz'):
+                reader = Block_Reader(filename)
+                random = Random(seed)
+                keys = [ random.choice(reader.keys) for _ in xrange(lookups) ]
+                _, seconds = timed(lambda: [ reader[k] for k in keys ])
+                reader.close()
+                results['read_%s_random_seconds' % name] = seconds / lookups
+    finally:
+        shutil.rmtree(folder)
+    return results
+
+
+def bench_startup(repeats=5):
+    """
+        Wall time to start the command line interface, for --help and for a command that only reads the cached features.
+    """
+    import subprocess
+    from feature_extraction.feature_store import cached_features
+
+    here = os.path.dirname(os.path.realpath(__file__))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.join(here, "..") + os.pathsep + env.get('PYTHONPATH', '')
+    devnull = open(os.devnull, 'w')
+
+    commands = [('startup_help_seconds', ['--help'])]
+    if os.path.exists(cached_features()):
+        commands.append(('startup_info_seconds', ['info']))
+
+    results = dict()
+    for name, arguments in commands:
+        best = None
+        for _ in xrange(repeats):
+            _, seconds = timed(subprocess.call, [sys.executable, os.path.join(here, "cli.py")] + arguments, stdout=devnull, env=env)
+            best = seconds if best is None else min(best, seconds)
+        results[name] = best
+    devnull.close()
+    return results
+
+
+def run(limit=None, seed=1, cached=True):
+    """
+        Runs all benchmarks, returns the results as a dictionary.
+        With _cached_ the classifier benchmarks use feature_extraction.Cached_Features (when it exists),
+            otherwise they use the features extracted during this run.
+    """
+    from att_classify import create_splits, data_select_specific_features
+
+    results = {'limit': limit, 'seed': seed}
+    print "Startup..."
+    results.update(bench_startup())
+
+    data = None
+    for corpus in CORPORA:
+        print "Preprocessing", corpus, "..."
+        docs, r = bench_preprocessing(corpus_files(corpus, limit, seed))
+        print "Extracting features", corpus, "..."
+        features, s = bench_feature_extraction(docs)
+        r.update(s)
+        for key, value in r.items():
+            results[corpus.split('-')[0].lower() + "_" + key] = value
+        if corpus == "Drexel-AMT-Corpus":
+            data = features
+
+    print "Tag mapping..."
+    results.update(bench_tag_mapping(corpus_files("Drexel-AMT-Corpus", limit, seed)))
+
+    if cached:
+        from feature_extraction.feature_store import load_features, cached_features
+        if os.path.exists(cached_features()):
+            data = load_features()
+        else:
+            print "No cached features, using the features of this run."
+
+    print "Read throughput..."
+    results.update(bench_read_throughput(data))
+
+    print "Preprocessor..."
+    results.update(bench_preprocessor(data))
+
+    print "Classifiers..."
+    data = natural_data(data)
+    sets = create_splits(data_select_specific_features(data), samples=1, num_authors=min(40, len(data)), splits_per_sample=1)
+    results.update(bench_classifiers(sets))
+
+    print "End to end..."
+    results.update(bench_end_to_end(data))
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+        Returns the metrics that got more than _tolerance_ (relative) worse than in _baseline_
+    """
+    regressions = []
+    for key, value in sorted(results.items()):
+        if key not in baseline or not baseline[key]:
+            continue
+        if key.endswith('_seconds'):
+            change = value / baseline[key] - 1
+        elif key.endswith('_per_second'):
+            change = baseline[key] / value - 1
+        else:
+            continue
+        if change > tolerance:
+            regressions.append((key, baseline[key], value, change))
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmarks over the bundled corpora")
+    parser.add_argument('--output', default="benchmark_results.json", help="where to write the results")
+    parser.add_argument('--baseline', help="results of an earlier run to compare with (default: classifications/benchmark_baseline.json, when it exists)")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument('--limit', type=int, help="number of texts per corpus to preprocess (default: all)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-cache', action='store_true', help="don't use the cached features")
+    args = parser.parse_args()
+
+    results = run(args.limit, args.seed, not args.no_cache)
+
+    f = open(args.output, 'w')
+    json.dump(results, f, indent=1, sort_keys=True)
+    f.close()
+    for key, value in sorted(results.items()):
+        print "%-55s %s" % (key, value)
+
+    if args.save_baseline:
+        f = open(BASELINE, 'w')
+        json.dump(results, f, indent=1, sort_keys=True)
+        f.close()
+        print "Baseline saved."
+        sys.exit(0)
+
+    if args.baseline is None and os.path.exists(BASELINE):
+        args.baseline = BASELINE
+    if args.baseline:
+        f = open(args.baseline)
+        baseline = json.load(f)
+        f.close()
+        regressions = compare(results, baseline, args.tolerance)
+        for key, old, new, change in regressions:
+            print "REGRESSION %-44s %.4g -> %.4g (%+.0f%%)" % (key, old, new, change * 100)
+        if regressions:
+            sys.exit(1)
+        print "No regressions."
@@ -0,0 +1,184 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    Two stage attribution for many candidate authors.
+    The multi-class SVM of att_classifiers.SVM_predict_rank trains one model per pair of authors,
+        which does not scale to thousands of authors. The cascade:
+        1. shortlists the _candidates_ closest authors of each unknown text, by the L1 distance to
+            the author centroids ('centroid') or to the nearest text of each author ('knn'),
+            on the normalized features
+        2. ranks the shortlisted authors with an SVM_Ranker fitted on their texts only
+    The full ranking is the SVM ranking of the shortlist followed by the other authors in first stage order.
+    Unknown texts with the same shortlist share one SVM.
+"""
+
+from time import time
+
+import numpy as np
+
+from helper_classes import Feature_Preprocessor
+from att_classifiers import SVM_Ranker, SVM_predict_rank
+from metrics import precision_at_ranks
+
+# Upper bound on the number of floats in one block of pairwise differences
+BLOCK_SIZE = 2 ** 24
+
+
+class Cascade_Ranker:
+    """
+        Ranks the authors of unknown texts with a cheap first stage and an SVM over the shortlist, see the module description.
+    """
+    def __init__(self, features, classes, candidates=10, first_stage='centroid'):
+        assert first_stage in ['centroid', 'knn'], "Unknown first stage: " + first_stage
+        self.features = features
+        self.candidates = candidates
+        self.first_stage = first_stage
+        self.rankers = dict()
+
+        self.FP = Feature_Preprocessor(features, True, False, 30)
+        train = np.asarray(self.FP.batch_normalize(features), dtype=float)
+        self.authors, codes = np.unique(np.asarray(classes), return_inverse=True)
+
+        # The training rows grouped by author, so per author reductions are one reduceat
+        order = np.argsort(codes, kind='mergesort')
+        self.train = train[order]
+        self.starts = np.flatnonzero(np.r_[True, codes[order][1:] != codes[order][:-1]])
+        self.rows = dict([ (i, order[self.starts[i]:end].tolist()) for i, end in enumerate(np.r_[self.starts[1:], len(order)]) ])
+        if first_stage == 'centroid':
+            counts = np.diff(np.r_[self.starts, len(order)])
+            self.centroids = np.add.reduceat(self.train, self.starts, axis=0) / counts[:, None]
+
+    def distances(self, unknown):
+        """
+            L1 distance of every unknown text to every author, one column per author in self.authors
+        """
+        unknown = np.asarray(self.FP.batch_normalize(unknown), dtype=float)
+        targets = self.centroids if self.first_stage == 'centroid' else self.train
+        step = max(1, BLOCK_SIZE // max(1, targets.size))
+        distances = np.empty((len(unknown), len(self.authors)))
+        for i in xrange(0, len(unknown), step):
+            d = np.abs(unknown[i:i + step, None, :] - targets[None, :, :]).sum(2)
+            if self.first_stage == 'knn':
+                d = np.minimum.reduceat(d, self.starts, axis=1)
+            distances[i:i + step] = d
+        return distances
+
+    def first_stage_order(self, unknown):
+        """
+            The author indexes of each unknown text, closest first
+        """
+        return np.argsort(self.distances(unknown), axis=1, kind='mergesort')
+
+    def ranker(self, shortlist):
+        # An SVM on the texts of the shortlisted authors, shared by all unknown texts with this shortlist
+        if shortlist not in self.rankers:
+            rows = [ r for a in shortlist for r in self.rows[a] ]
+            self.rankers[shortlist] = SVM_Ranker([ self.features[r] for r in rows ], [ self.authors[a] for a in shortlist for _ in self.rows[a] ])
+        return self.rankers[shortlist]
+
+    def rankings(self, unknown, order=None):
+        """
+            The full author ranking (names, most likely first) of each unknown text
+        """
+        if order is None:
+            order = self.first_stage_order(unknown)
+        groups = dict()
+        for i, row in enumerate(order):
+            groups.setdefault(tuple(sorted(row[:self.candidates].tolist())), []).append(i)
+
+        rankings = [ None for _ in xrange(len(order)) ]
+        for shortlist, indexes in groups.items():
+            if len(shortlist) > 1:
+                ranker = self.ranker(shortlist)
+                scores = ranker.scores([ unknown[i] for i in indexes ])
+                for i, s in zip(indexes, scores):
+                    # Stable, so equal scores keep the order of the classes as in SVM_predict_rank
+                    ranked = ranker.clf.classes_[np.argsort(-s, kind='mergesort')].tolist()
+                    rankings[i] = ranked + self.authors[order[i][self.candidates:]].tolist()
+            else:
+                for i in indexes:
+                    rankings[i] = self.authors[order[i]].tolist()
+        return rankings
+
+    def rank(self, unknown, actual_classes, order=None):
+        """
+            The rank of the actual author of each unknown text, as SVM_predict_rank gives it
+        """
+        return [ r.index(a) for r, a in zip(self.rankings(unknown, order), actual_classes) ]
+
+
+def cascade_predict_rank(features, classes, unknown, actual_classes, candidates=10, first_stage='centroid'):
+    """
+        SVM_predict_rank through a Cascade_Ranker, can be given to att_classify.get_precision_at_rank as method
+    """
+    return Cascade_Ranker(features, classes, candidates, first_stage).rank(unknown, actual_classes)
+
+
+def recall_report(sets, ns=(2, 5, 10, 20), first_stage='centroid', full=True):
+    """
+        Shows how much the pruning costs: for every shortlist size N, the fraction of texts whose author
+            is in the shortlist (recall), the precision at rank 1 of the cascade and the seconds spent.
+        With _full_ the plain SVM over all authors is added as N = all.
+        Returns the rows (N, recall, precision, seconds).
+    """
+    rows = []
+    first_ranks = dict([ (n, []) for n in ns ])
+    cascade_ranks = dict([ (n, []) for n in ns ])
+    seconds = dict([ (n, 0.0) for n in ns ])
+    for (inset_f, inset_c), (outset_f, outset_c) in [ s[:2] for s in sets ]:
+        start = time()
+        cascade = Cascade_Ranker(inset_f, inset_c, max(ns), first_stage)
+        order = cascade.first_stage_order(outset_f)
+        shared = time() - start
+        authors = cascade.authors.tolist()
+        positions = [ order[i].tolist().index(authors.index(a)) for i, a in enumerate(outset_c) ]
+        for n in ns:
+            start = time()
+            cascade.candidates = n
+            cascade_ranks[n] += cascade.rank(outset_f, outset_c, order)
+            first_ranks[n] += positions
+            seconds[n] += shared + time() - start
+
+    for n in ns:
+        recall = np.mean(np.asarray(first_ranks[n]) < n)
+        rows.append((n, recall, precision_at_ranks(cascade_ranks[n], 1)[0], seconds[n]))
+
+    if full:
+        start = time()
+        ranks = []
+        for (inset_f, inset_c), (outset_f, outset_c) in [ s[:2] for s in sets ]:
+            ranks += SVM_predict_rank(inset_f, inset_c, outset_f, outset_c)
+        rows.append(('all', 1.0, precision_at_ranks(ranks, 1)[0], time() - start))
+
+    print "N\trecall\tprecision\tseconds"
+    for n, recall, precision, s in rows:
+        print "%s\t%.4f\t%.4f\t%.2f" % (n, recall, precision, s)
+    return rows
+
+
+if __name__ == '__main__':
+    from att_classify import create_splits, data_select_specific_features
+    from feature_extraction.feature_store import load_features
+    print "Loading data.."
+    data = data_select_specific_features(load_features())
+    print "Working..."
+
+    sets = create_splits(data, samples=2, num_authors=len(data), splits_per_sample=1)
+    recall_report(sets)
+
+    from feature_extraction import profiling
+    if profiling.ENABLED:
+        profiling.report()
@@ -0,0 +1,141 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    Regression check of att_classify.create_splits(_attack) against the implementation they replaced
+        (kept below as baseline_splits and baseline_splits_attack), which every published result was made with.
+    Run from the repository root:
+        PYTHONPATH=. python classifications/check_splits.py
+    Checks the corpora in Data/ (every text stands for itself, no features are needed) and random data sets.
+"""
+
+import os, sys
+from random import seed, sample, shuffle, Random
+
+from att_classify import create_splits, create_splits_attack
+from splits import name_has_substring
+
+DATA = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../Data/")
+SETTINGS = [(2, 40, 1), (2, 10, 2), (1, 80, 3)]
+
+
+def baseline_splits_attack(data, num_authors=40, samples=1, exclude=['verification', 'imitation'], attack=['obfuscation']):
+    sets = []
+    seed(1)
+    for authorset in [ sample(sorted(data.keys()), num_authors) for _ in xrange(samples) ]:
+        inset_f = []
+        inset_c = []
+        outset_f = []
+        outset_c = []
+        for author in authorset:
+            for story in data[author].keys():
+                if not name_has_substring(story, exclude):
+                    if name_has_substring(story, attack):
+                        outset_f.append(data[author][story])
+                        outset_c.append(author)
+                    else:
+                        inset_f.append(data[author][story])
+                        inset_c.append(author)
+        sets.append(((inset_f, inset_c),(outset_f, outset_c)))
+
+    return sets
+
+
+def baseline_splits(data, samples=2, num_authors=40, splits_per_sample=1, exclude=['verification', 'imitation', 'obfuscation']):
+    seed(1)
+
+    clean_stories = dict()
+    for author in data.keys():
+        author_stories = filter(lambda x : not name_has_substring(x, exclude), data[author].keys())
+        clean_stories[author] = dict([ (k, data[author][k]) for k in author_stories])
+
+    assert min([len(x) for x in clean_stories.values()]) >= splits_per_sample, "More splits per sample than there are samples"
+
+    author_to_storylist = dict( [(a, sorted(clean_stories[a].keys())) for a in clean_stories.keys()] )
+    sets = []
+
+    for subset in [ sample(sorted(clean_stories.keys()), num_authors) for _ in xrange(samples) ]:
+        subset = dict([ (k, clean_stories[k]) for k in subset ])
+        [ shuffle(author_to_storylist[k]) for k in author_to_storylist.keys() ]
+        for index in xrange(splits_per_sample):
+            inset_f = []
+            inset_c = []
+            outset_f = []
+            outset_c = []
+            for author in subset:
+                for i in xrange(len(author_to_storylist[author])):
+                    if i == index:
+                        outset_f.append(subset[author][author_to_storylist[author][i]])
+                        outset_c.append(author)
+                    else:
+                        inset_f.append(subset[author][author_to_storylist[author][i]])
+                        inset_c.append(author)
+
+            sets.append(((inset_f, inset_c),(outset_f, outset_c)))
+
+    return sets
+
+
+def corpus_data(corpus):
+    """
+        {author: {story: (author, story)}} of a corpus in Data/
+    """
+    folder = os.path.join(DATA, corpus)
+    data = dict()
+    for author in os.listdir(folder):
+        if not author.startswith(".") and os.path.isdir(os.path.join(folder, author)):
+            data[author] = dict([ (s, (author, s)) for s in os.listdir(os.path.join(folder, author)) if not s.startswith(".") ])
+    return data
+
+
+def random_data(random, authors=60, stories=(5, 15)):
+    data = dict()
+    for a in random.sample(xrange(10000), authors):
+        author = "a%d" % a
+        names = [ "%s_%02d" % (author, random.randint(0, 99)) for _ in xrange(random.randint(*stories)) ]
+        names += [ author + "_obfuscation", author + "_imitation_01", author + "_verification" ]
+        data[author] = dict([ (s, (author, s)) for s in names ])
+    return data
+
+
+def check(data, name):
+    """
+        Returns the number of settings where the splits differ from the baseline, and prints them
+    """
+    failures = 0
+    authors = len(data)
+    shortest = min([ len([ s for s in d if not name_has_substring(s, ['verification', 'imitation', 'obfuscation']) ]) for d in data.values() ])
+    for samples, num_authors, splits_per_sample in SETTINGS:
+        if num_authors > authors or splits_per_sample > shortest:
+            continue
+        if create_splits(data, samples, num_authors, splits_per_sample) != baseline_splits(data, samples, num_authors, splits_per_sample):
+            print "DIFFERENT %s create_splits samples=%d num_authors=%d splits_per_sample=%d" % (name, samples, num_authors, splits_per_sample)
+            failures += 1
+        if create_splits_attack(data, num_authors, samples) != baseline_splits_attack(data, num_authors, samples):
+            print "DIFFERENT %s create_splits_attack samples=%d num_authors=%d" % (name, samples, num_authors)
+            failures += 1
+    return failures
+
+
+if __name__ == '__main__':
+    failures = 0
+    for corpus in sorted(os.listdir(DATA)):
+        if os.path.isdir(os.path.join(DATA, corpus)):
+            failures += check(corpus_data(corpus), corpus)
+    random = Random(1)
+    for trial in xrange(30):
+        failures += check(random_data(random), "random data set %d" % trial)
+    print "%d differences" % failures
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,266 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    One command line entry point for the experiments. Run from the repository root:
+        PYTHONPATH=. python classifications/cli.py <command> [options]
+
+    Every heavy import (sklearn, pattern, NLTK, the cached features) happens inside the command that needs it,
+        so starting up costs next to nothing.
+"""
+
+import os, sys, argparse
+
+DEFAULT_FEATURES = ['mono_char_dist', 'mono_chunk_dist', 'bi_tag_dist', 'word_length', 'legomena', 'bi_char_dist', 'readability', 'mono_tag_dist']
+
+
+def feature_list(value):
+    """
+        Parses a comma separated list of feature names, 'all' selects all features.
+    """
+    if value == 'all':
+        return False
+    return value.split(',')
+
+
+def load_data():
+    from feature_extraction.feature_store import load_features
+    return load_features()
+
+
+def command_info(args):
+    data = load_data()
+    stories = sum([ len(x) for x in data.values() ])
+    names = sorted(data[data.keys()[0]].values()[0][1].keys())
+    print "Authors:", len(data)
+    print "Stories:", stories
+    print "Feature groups:", ", ".join(names)
+
+
+def command_update_features(args):
+    from feature_extraction.feature_store import update_features
+    updated = update_features(None, args.documents)
+    print "Updated:", ", ".join(updated) if updated else "nothing, all feature groups are current"
+
+
+def command_compress(args):
+    from feature_extraction.feature_store import compress_features
+    from feature_extraction.block_store import convert_shelve
+    if args.shelve:
+        output = args.output or os.path.splitext(args.shelve)[0] + ".blkz"
+        convert_shelve(args.shelve, output, codec=args.codec)
+    else:
+        output = compress_features(args.features, args.output, args.codec)
+    print "Wrote", output
+
+
+def command_extract(args):
+    """
+        Prints the features of each file as one JSON line.
+        With --stdin the file names are read from standard input, one per line,
+            so one process with loaded taggers can serve many requests.
+    """
+    import json
+    from feature_extraction.create_Datasets import load_file, load_taggers
+    from feature_extraction.feature_extraction import get_features
+
+    if args.preload:
+        load_taggers(warm_up=True)
+
+    def extract(filename):
+        features, feature_dic = get_features(*load_file(filename))
+        print json.dumps({'file': filename, 'features': feature_dic}, sort_keys=True)
+        sys.stdout.flush()
+
+    for filename in args.files:
+        extract(filename)
+    if args.stdin:
+        for line in iter(sys.stdin.readline, ''):
+            if line.strip():
+                extract(line.strip())
+
+
+def command_survey(args):
+    from feature_selection import survey
+    survey(load_data(), attack=args.attack, heavy=args.heavy, features=args.features, processes=args.processes)
+
+
+def command_rank(args):
+    from att_classify import get_precision_at_rank, create_splits, create_splits_attack, data_select_specific_features
+
+    data = data_select_specific_features(load_data(), args.features)
+    if args.attack:
+        sets = create_splits_attack(data, num_authors=args.authors, samples=args.samples)
+    else:
+        sets = create_splits(data, samples=args.samples, num_authors=args.authors, splits_per_sample=args.splits)
+    if args.cascade:
+        from cascade import cascade_predict_rank
+        get_precision_at_rank(sets, lambda f, c, u, a : cascade_predict_rank(f, c, u, a, args.cascade, args.first_stage))
+    else:
+        get_precision_at_rank(sets)
+
+
+def command_select_features(args):
+    import feature_selection
+    import att_classifiers
+
+    method = {'svm': att_classifiers.SVM_predict, 'knn': att_classifiers.KNeighborsClassifier_predict}[args.method]
+    data = load_data()
+    if args.search == 'solo':
+        feature_selection.rank_features_solo(data, method, heavy=args.heavy)
+    elif args.search == 'dropout':
+        feature_selection.rank_features_dropout(data, method, heavy=args.heavy)
+    elif args.search in ['race-bu', 'race-td']:
+        print feature_selection.creat_good_featureset_racing(data, method, bottom_up=args.search == 'race-bu', attack=args.attack, heavy=args.heavy)
+    elif args.search == 'td':
+        print feature_selection.creat_good_featureset_TD(data, method, attack=args.attack, heavy=args.heavy)
+    else:
+        print feature_selection.creat_good_featureset_BU(data, method, attack=args.attack, heavy=args.heavy)
+
+
+def command_deobf(args):
+    from importlib import import_module
+    from att_classify import data_select_specific_features
+    deobf = import_module('de-obf_classify')
+
+    data = data_select_specific_features(load_data(), args.features)
+    sets = deobf.create_splits(data, samples=args.samples)
+    average = lambda x : sum(x) / len(x)
+    precisions = deobf.evaluate_deobfuscation_modes(sets, args.modes)
+    for mode in args.modes:
+        ranks = precisions[mode]
+        print "deobf:"+mode, ",  ave(recall):", average(ranks), ranks
+
+
+def command_scan(args):
+    from attack_scan import train_detector, scan
+    if args.train or not os.path.exists(args.detector):
+        print "Training the detector..."
+        train_detector(load_data(), args.features).save(args.detector)
+    scan(args.cache, args.detector, args.output, args.processes, args.chunk_size, args.top)
+
+
+def command_verify(args):
+    from att_classify import data_select_specific_features
+    from verification import load_models, evaluate_verification
+    data = data_select_specific_features(load_data(), args.features)
+    models = load_models(data, args.models or "verification_" + args.method + ".pickle", args.method, args.features)
+    evaluate_verification(data, models)
+
+
+def command_search(args):
+    from att_classify import create_splits, data_select_specific_features
+    from parameter_search import search
+
+    data = data_select_specific_features(load_data(), args.features)
+    sets = create_splits(data, samples=args.samples, splits_per_sample=args.splits)
+    rows = search(sets, args.method, args.strategy, processes=args.processes, filename=args.output)
+    for config, folds, precision, seconds in rows[:10]:
+        print "%.4f\t%d folds\t%s" % (precision, folds, config)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Computational stylometry experiments")
+    parser.add_argument('--profile', action='store_true', help="record and print the time spent per stage")
+    commands = parser.add_subparsers(dest='command')
+
+    p = commands.add_parser('info', help="summarize the cached features")
+    p.set_defaults(function=command_info)
+
+    p = commands.add_parser('extract', help="extract the features of text files")
+    p.add_argument('files', nargs='*')
+    p.add_argument('--stdin', action='store_true', help="keep reading file names from standard input")
+    p.add_argument('--preload', action='store_true', help="load the tagger models before the first file")
+    p.set_defaults(function=command_extract)
+
+    p = commands.add_parser('update-features', help="compute the feature groups that are missing or outdated")
+    p.add_argument('--documents', help="cached preprocessed documents (default: feature_extraction/Dataset.blkz, Dataset.cdoc or Dataset.py)")
+    p.set_defaults(function=command_update_features)
+
+    p = commands.add_parser('compress', help="copy the cached features, or a blog cache, into a block compressed container")
+    p.add_argument('--features', help="cached feature file (default: the one load_features reads)")
+    p.add_argument('--shelve', help="blog shelve to convert instead (see feature_extraction.create_cached_features_blog)")
+    p.add_argument('--output', help="container to write (default: next to the source, as .blkz)")
+    p.add_argument('--codec', choices=['zlib', 'bz2'], default='zlib')
+    p.set_defaults(function=command_compress)
+
+    p = commands.add_parser('survey', help="survey the classifiers")
+    p.add_argument('--heavy', action='store_true')
+    p.add_argument('--attack', action='store_true')
+    p.add_argument('--features', type=feature_list, default=False, help="comma separated feature names (default: all)")
+    p.add_argument('--processes', type=int, default=1, help="number of folds evaluated in parallel")
+    p.set_defaults(function=command_survey)
+
+    p = commands.add_parser('rank', help="precision at rank of the SVM")
+    p.add_argument('--samples', type=int, default=10)
+    p.add_argument('--authors', type=int, default=10)
+    p.add_argument('--splits', type=int, default=2)
+    p.add_argument('--attack', action='store_true')
+    p.add_argument('--features', type=feature_list, default=DEFAULT_FEATURES)
+    p.add_argument('--cascade', type=int, help="shortlist this many authors before the SVM (default: no shortlist)")
+    p.add_argument('--first-stage', choices=['centroid', 'knn'], default='centroid', help="how the cascade shortlists")
+    p.set_defaults(function=command_rank)
+
+    p = commands.add_parser('select-features', help="feature selection")
+    p.add_argument('--search', choices=['solo', 'dropout', 'td', 'bu', 'race-td', 'race-bu'], default='solo')
+    p.add_argument('--method', choices=['svm', 'knn'], default='svm')
+    p.add_argument('--heavy', action='store_true')
+    p.add_argument('--attack', action='store_true')
+    p.set_defaults(function=command_select_features)
+
+    p = commands.add_parser('deobf', help="attribution of obfuscated texts with de-obfuscation")
+    p.add_argument('--samples', type=int, default=1)
+    p.add_argument('--modes', type=lambda x : x.split(','), default=['never', 'detect', 'always'])
+    p.add_argument('--features', type=feature_list, default=DEFAULT_FEATURES)
+    p.set_defaults(function=command_deobf)
+
+    p = commands.add_parser('scan', help="rank the posts of a blog feature cache by how likely they are attacks")
+    p.add_argument('cache', help="blog feature cache (see feature_extraction.create_cached_features_blog)")
+    p.add_argument('--detector', default="attack_detector.pickle", help="trained detector, made when missing")
+    p.add_argument('--train', action='store_true', help="train the detector again")
+    p.add_argument('--features', type=feature_list, default=False)
+    p.add_argument('--output', default="attack_scan.tsv")
+    p.add_argument('--processes', type=int, default=1)
+    p.add_argument('--chunk-size', type=int, default=10000)
+    p.add_argument('--top', type=int, default=1000, help="number of posts in the report")
+    p.set_defaults(function=command_scan)
+
+    p = commands.add_parser('verify', help="evaluate author verification on the verification texts")
+    p.add_argument('--method', choices=['profile', 'ocsvm'], default='profile')
+    p.add_argument('--models', help="model cache file (default: verification_<method>.pickle)")
+    p.add_argument('--features', type=feature_list, default=False)
+    p.set_defaults(function=command_verify)
+
+    p = commands.add_parser('search', help="hyperparameter search for a classifier")
+    p.add_argument('--method', choices=['svm', 'knn', 'adaboost'], default='svm')
+    p.add_argument('--strategy', choices=['grid', 'random', 'halving'], default='halving')
+    p.add_argument('--samples', type=int, default=10)
+    p.add_argument('--splits', type=int, default=2)
+    p.add_argument('--processes', type=int, default=1)
+    p.add_argument('--output', default="search_results.tsv", help="tab separated results table")
+    p.add_argument('--features', type=feature_list, default=False)
+    p.set_defaults(function=command_search)
+
+    args = parser.parse_args(argv)
+    if args.profile:
+        from feature_extraction import profiling
+        profiling.enable()
+    args.function(args)
+    if args.profile:
+        profiling.report()
+
+
+if __name__ == '__main__':
+    main()
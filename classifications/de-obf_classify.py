@@ -13,12 +13,14 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from random import seed, sample
+from random import Random
 
 from helper_classes import Feature_Preprocessor
+from feature_extraction.profiling import stage
 
-from att_classifiers import SVM_predict_rank
+from att_classifiers import SVM_predict_rank, SVM_Ranker
 from att_classify import name_has_substring, data_select_specific_features
+from metrics import precision_at_ranks
 
 
 def AdaBoostClassifier_predict_texttype(features, classes, unknown):
@@ -33,9 +35,11 @@ def AdaBoostClassifier_predict_texttype(features, classes, unknown):
     unknown = FP.batch_normalize(unknown)
 
     clf = AdaBoostClassifier(n_estimators=80, learning_rate=0.998, algorithm='SAMME.R', random_state=1)
-    clf.fit(features, classes)
+    with stage("detector.fit"):
+        clf.fit(features, classes)
 
-    return clf.predict(unknown)
+    with stage("detector.predict"):
+        return clf.predict(unknown)
 
 
 def create_splits(data, samples=10, exclude=['verification', 'imitation', 'obfuscation'], attack=['obfuscation']):
@@ -45,8 +49,8 @@ def create_splits(data, samples=10, exclude=['verification', 'imitation', 'obfus
         Works similarly as att_classify.create_splits_attack, but also ads obf vs natural pairs.
     """
     sets = []
-    seed(1)     # Set seed to always have same outcome
-    authorsets = [ sample(sorted(data.keys()), 40) for _ in xrange(samples) ]   # sort for same outcome on different systems
+    random = Random(1)     # Own random stream, to always have same outcome
+    authorsets = [ random.sample(sorted(data.keys()), 40) for _ in xrange(samples) ]   # sort for same outcome on different systems
     for authorset in authorsets:    # Loop over different selections of authors
         for exclude_author in authorset:    # Loop over different authors to leave out and attribute the obfuscated text of.
             inset_f = []
@@ -90,15 +94,6 @@ def get_precision_at_rank(sets, deobf='detect', method=SVM_predict_rank):
             deobfuscation can be done: ['never', 'detect', 'always']
             So, never deobfuscate, only if obfuscation is detected, or always.
     """
-    def precisions_at_ranks(ranks, setsize):
-        """
-            Calculate the recall/precision at each rank.
-        """
-        precisions = []
-        for i in xrange(setsize):
-            precisions.append( sum([ r <= i for r in ranks ])/float(len(ranks)) )
-        return precisions
-
     def cross_validate(sets, deobf, method):
         def get_score(method, (inset_f, inset_c), (outset_f, outset_c), pairs):
             if (deobf == 'detect' and text_is_obfuscated(outset_f, pairs)) or deobf == 'always':
@@ -111,10 +106,36 @@ def get_precision_at_rank(sets, deobf='detect', method=SVM_predict_rank):
         return rankings
 
     rankings = cross_validate(sets, deobf, method)
-    precisions = precisions_at_ranks(rankings, len(set(sets[0][0][1])))
+    precisions = precision_at_ranks(rankings, len(set(sets[0][0][1])))
     return precisions
 
 
+def evaluate_deobfuscation_modes(sets, modes=('never', 'detect', 'always')):
+    """
+        get_precision_at_rank with the SVM ranking for several de-obfuscation _modes_ in one pass.
+        Per fold the ranker is fitted once, the original and the de-obfuscated text are both ranked with it,
+            and for 'detect' the detector decides which of the two rankings counts.
+        Returns a dictionary from mode to the precisions at each rank.
+    """
+    rankings = dict([ (mode, []) for mode in modes ])
+    for (inset_f, inset_c), (outset_f, outset_c), pairs in sets:
+        ranker = SVM_Ranker(inset_f, inset_c)
+        original = ranker.rank(outset_f, outset_c)
+        deobfuscated = None
+        if 'always' in modes or 'detect' in modes:
+            deobfuscated = ranker.rank(perform_deobfuscation(outset_f[0], pairs), outset_c)
+
+        if 'never' in modes:
+            rankings['never'] += original
+        if 'always' in modes:
+            rankings['always'] += deobfuscated
+        if 'detect' in modes:
+            rankings['detect'] += deobfuscated if text_is_obfuscated(outset_f, pairs) else original
+
+    setsize = len(set(sets[0][0][1]))
+    return dict([ (mode, precision_at_ranks(rankings[mode], setsize)) for mode in modes ])
+
+
 def perform_deobfuscation(outset_f, pairs):
     """
         Perform deobfuscation of _outset_f_ by learning the obfuscationbehavior of _pairs_
@@ -155,7 +176,8 @@ def text_is_obfuscated(outset_f, pairs):
 
 if __name__ == '__main__':
     print "Loading data.."
-    from feature_extraction.Cached_Features import data
+    from feature_extraction.feature_store import load_features
+    data = load_features()
     print "Working..."
 
     features=['mono_char_dist', 'mono_chunk_dist', 'bi_tag_dist', 'word_length', 'legomena', 'bi_char_dist', 'readability', 'mono_tag_dist']
@@ -166,8 +188,9 @@ if __name__ == '__main__':
 
     average = lambda x : sum(x) / len(x)
 
+    precisions = evaluate_deobfuscation_modes(sets)
     for deobf in ['never', 'detect', 'always']:
-        ranks = get_precision_at_rank(sets, deobf=deobf)
+        ranks = precisions[deobf]
         print "deobf:"+deobf, ",  ave(recall):", average(ranks), ranks
 
     print "Done"
\ No newline at end of file
@@ -13,9 +13,13 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from att_classify import cross_validate, create_splits, create_splits_attack, data_select_specific_features
+from att_classify import cross_validate, cross_validate_methods, create_splits, create_splits_attack, data_select_specific_features
 
 from att_classifiers import *
+from metrics import accuracy
+
+from math import sqrt
+from random import Random
 
 
 def feature_names(data):
@@ -29,7 +33,7 @@ def get_precision(prediction, classes):
     """
         Returns the relative number of correct answers.
     """
-    return sum([ 1 if x[0]==x[1] else 0 for x in zip(prediction, classes)])/float(len(classes))
+    return accuracy(prediction, classes)
 
 
 def creat_good_featureset_BU(data, method, attack=False, selection=[], heavy=False):
@@ -136,12 +140,18 @@ def rank_features_dropout(data, method, heavy=False):
     print
 
 
-def survey(data, attack=False, heavy=False, features=False):
+def survey(data, attack=False, heavy=False, features=False, processes=1, num_authors=40):
     """
         Survey common machine learning methods on the data
         In heavy mode: performs large cross validation.
         Otherwise: performs very light testing.
+        Every fold is normalized once and shared by all methods.
+        With _processes_ > 1 the folds run in parallel processes on a shared_dataset.Shared_Dataset,
+            the workers only get the row indexes of their folds.
+        The natural splits take _num_authors_ authors per sample.
     """
+    from splits import Natural_Splits, Attack_Splits
+
     data = data_select_specific_features(data, features)
 
     if not heavy:
@@ -151,16 +161,17 @@ def survey(data, attack=False, heavy=False, features=False):
         samples = 80
         splits_per_sample = 13
 
+    # The folds of create_splits_attack(data, samples) and create_splits, as row indexes
     if attack:
-        sets = create_splits_attack(data, samples)
+        splits = Attack_Splits(data, samples, compat=True)
     else:
-        sets = create_splits(data, samples, splits_per_sample=splits_per_sample)
+        splits = Natural_Splits(data, samples, num_authors, splits_per_sample, compat=True)
 
     methods = [
-        ('NearestNeighbors', KNeighborsClassifier_predict),
-        ('svm', SVM_predict),
-        #('AdaBoost', AdaBoostClassifier_predict),
-        #('DecisionTreeClassifier', DecisionTreeClassifier_predict),
+        ('NearestNeighbors', 'knn'),
+        ('svm', 'svm'),
+        #('AdaBoost', 'adaboost'),
+        #('DecisionTreeClassifier', 'decision_tree'),
         ]
 
     texttype = "natural"
@@ -170,11 +181,24 @@ def survey(data, attack=False, heavy=False, features=False):
     if not heavy:
         msg += "non-"
     print msg + "heavy)"
-    print "(uniform) prior:", 1.0/len(sets[0][1][1])
-
+    print "(uniform) prior:", 1.0/len(splits[0][1])
+
+    print "Cross validating", ", ".join([ name for name, _ in methods ]), "..."
+    names = [ method for _, method in methods ]
+    if processes > 1:
+        import os
+        from shared_dataset import Shared_Dataset, cross_validate_shared
+        # Rows of both are the (author, story) pairs sorted by author and story
+        dataset = Shared_Dataset.create(data, "survey_%d" % os.getpid())
+        try:
+            results = cross_validate_shared(dataset, list(splits), names, processes)
+        finally:
+            dataset.remove()
+    else:
+        results = cross_validate_methods(splits.sets(data), names)
     for (name, method) in methods:
-        print "Cross validating", name, "..."
-        print "   \t", get_precision(*cross_validate(sets, method=method, verbose=False))
+        print name
+        print "   \t", get_precision(*results[method])
     print
 
 
@@ -198,9 +222,160 @@ def get_precision_for_configuration(data, method, features=False, heavy=False, a
     return get_precision(*cross_validate(sets, method=method, verbose=False))
 
 
+class Racing_Evaluator:
+    """
+        Compares candidate feature selections on the splits of a heavy evaluation,
+            without spending all splits on candidates that are clearly losing.
+        All candidates are scored on _min_folds_ splits, then the splits are multiplied by _eta_ for the candidates
+            that are still in contention, until one is left or all splits are used.
+        A candidate drops out when it is worse than the current best with confidence: the upper bound of the
+            _z_ confidence interval of its per split difference with the best (the splits are paired) is below 0.
+        Scores are kept per (candidate, split), so a candidate in a later race (like the incumbent of a greedy search)
+            is not fitted again.
+        The selected features of a candidate are only kept while it is still in the race.
+    """
+    def __init__(self, data, method, attack=False, heavy=True, min_folds=4, eta=2, z=1.96, seed=1):
+        self.data = data
+        self.method = method
+        self.min_folds = min_folds
+        self.eta = eta
+        self.z = z
+        self.scores = dict()
+        self.selected = dict()
+        self.fits = 0
+
+        # The splits only depend on the names, so they are made once, with (author, story) in place of the features
+        keys = dict([ (a, dict([ (s, (a, s)) for s in data[a].keys() ])) for a in data.keys() ])
+        samples, splits_per_sample = (80, 13) if heavy else (2, 1)
+        if attack:
+            folds = create_splits_attack(keys, samples=samples)
+        else:
+            folds = create_splits(keys, samples=samples, splits_per_sample=splits_per_sample)
+        # Splits of one sample share their authors, so they are raced in a shuffled order
+        order = range(len(folds))
+        Random(seed).shuffle(order)
+        self.folds = [ folds[i] for i in order ]
+
+    def fold_score(self, features, i):
+        key = (candidate_key(features), i)
+        if key not in self.scores:
+            if candidate_key(features) not in self.selected:
+                self.selected[candidate_key(features)] = data_select_specific_features(self.data, features)
+            data = self.selected[candidate_key(features)]
+            (inset_k, inset_c), (outset_k, outset_c) = self.folds[i]
+            prediction = self.method([ data[a][s] for a, s in inset_k ], inset_c, [ data[a][s] for a, s in outset_k ])
+            self.scores[key] = accuracy(prediction, outset_c)
+            self.fits += 1
+        return self.scores[key]
+
+    def evict(self, alive):
+        """
+            Drops the selected features of the candidates that are not in _alive_
+        """
+        keep = set([ candidate_key(c) for c in alive ])
+        for key in self.selected.keys():
+            if key not in keep:
+                del self.selected[key]
+
+    def interval(self, values):
+        """
+            Mean and the bounds of its confidence interval
+        """
+        mean = sum(values) / float(len(values))
+        if len(values) < 2:
+            return mean, float('-inf'), float('inf')
+        sd = sqrt(sum([ (v - mean) ** 2 for v in values ]) / (len(values) - 1))
+        margin = self.z * sd / sqrt(len(values))
+        return mean, mean - margin, mean + margin
+
+    def loses(self, features, best, n):
+        differences = [ self.fold_score(features, i) - self.fold_score(best, i) for i in xrange(n) ]
+        return self.interval(differences)[2] < 0
+
+    def race(self, candidates):
+        """
+            Races the _candidates_ (feature lists, False for all features).
+            Returns the rows (features, splits, mean precision, low, high), best first, and the number of fits saved
+                compared to evaluating every candidate on every split.
+        """
+        fits = self.fits
+        total = len(self.folds)
+        alive = list(candidates)
+        n = min(self.min_folds, total)
+        while True:
+            for c in alive:
+                for i in xrange(n):
+                    self.fold_score(c, i)
+            if len(alive) == 1 or n == total:
+                break
+            best = max(alive, key=lambda c : self.interval([ self.fold_score(c, i) for i in xrange(n) ])[0])
+            alive = [ c for c in alive if c is best or not self.loses(c, best, n) ]
+            n = min(n * self.eta, total)
+            self.evict(alive)
+        self.evict([])
+
+        rows = []
+        for c in candidates:
+            done = [ self.scores[(candidate_key(c), i)] for i in xrange(total) if (candidate_key(c), i) in self.scores ]
+            rows.append((c, len(done)) + self.interval(done))
+        rows = sorted(rows, key=lambda x : (x[1], x[2]), reverse=True)
+        # Scores cached from earlier races count as saved too
+        saved = len(candidates) * total - (self.fits - fits)
+        return rows, saved
+
+
+def candidate_key(features):
+    return None if features == False else tuple(sorted(features))
+
+
+def print_race(rows, saved):
+    for features, splits, mean, low, high in rows:
+        print "\t%.4f [%.4f, %.4f]  splits: %d  %s" % (mean, low, high, splits, "all" if features == False else ", ".join(sorted(features)))
+    print "\tFits saved:", saved
+
+
+def creat_good_featureset_racing(data, method, bottom_up=True, selection=None, attack=False, heavy=True, **kwargs):
+    """
+        creat_good_featureset_BU (_bottom_up_) or creat_good_featureset_TD, with every step decided by a race
+            between the current selection and all selections one feature away from it.
+        Stops when the current selection wins.
+    """
+    print "Creating good featureset", "Bottom Up" if bottom_up else "Top Down", "(racing)"
+    evaluator = Racing_Evaluator(data, method, attack=attack, heavy=heavy, **kwargs)
+    names = feature_names(data)
+    if selection is None:
+        selection = [] if bottom_up else list(names)
+
+    saved = 0
+    while True:
+        if bottom_up:
+            candidates = [ selection + [name] for name in names if name not in selection ]
+        else:
+            candidates = [ [ n for n in selection if n != name ] for name in selection if len(selection) > 1 ]
+        if selection:
+            candidates = [selection] + candidates
+        if not candidates:
+            break
+        rows, s = evaluator.race(candidates)
+        saved += s
+        print_race(rows, s)
+        winner = rows[0][0]
+        if winner is selection:
+            break
+        print "\tFound improvement:", rows[0][2], sorted(winner)
+        selection = winner
+        if len(candidates) == 1:
+            break
+
+    precision = [ r[2] for r in rows if r[0] is selection ][0] if selection else -1
+    print "Total fits saved:", saved
+    return precision, selection
+
+
 if __name__ == '__main__':
     print "Loading data.."
-    from feature_extraction.Cached_Features import data
+    from feature_extraction.feature_store import load_features
+    data = load_features()
     print "Working..."
 
     # Use _heavy_ = False for a short demo/test
@@ -216,4 +391,8 @@ if __name__ == '__main__':
 
     print creat_good_featureset_TD(data, SVM_predict, attack=False, heavy=heavy)
     print
-    print creat_good_featureset_BU(data, SVM_predict, attack=False, heavy=heavy)
\ No newline at end of file
+    print creat_good_featureset_BU(data, SVM_predict, attack=False, heavy=heavy)
+
+    from feature_extraction import profiling
+    if profiling.ENABLED:
+        profiling.report()
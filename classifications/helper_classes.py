@@ -13,6 +13,10 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import sys
+
+from feature_extraction.profiling import profiled
+
 
 class Feature_Preprocessor:
     """
@@ -22,6 +26,7 @@ class Feature_Preprocessor:
             - Centralizes data using Z-score
             - Performs PCA to reduce data
     """
+    @profiled("preprocessor.fit")
     def __init__(self, matrix, centralize=True, pca=True, components=30):
         self.set_prune_indexes(matrix)
 
@@ -39,6 +44,7 @@ class Feature_Preprocessor:
         else:
             self.pca = lambda x : x
 
+    @profiled("preprocessor.transform")
     def batch_normalize(self, matrix):
         new_matrix = []
         for row in matrix:
@@ -84,4 +90,167 @@ class Feature_Preprocessor:
         from sklearn.decomposition import PCA
         analizer = PCA(n_components=components)
         analizer.fit(matrix)
-        self.pca = lambda x : analizer.transform([x])[0]
\ No newline at end of file
+        self.pca = lambda x : analizer.transform([x])[0]
+
+
+class Zscore_Normalizer:
+    """
+        The pruning and z-score of Feature_Preprocessor (fitted by it on _matrix_), applied to whole arrays of rows at once.
+        Keeps only numpy arrays, so it pickles along with the models that use it.
+    """
+    def __init__(self, matrix):
+        import numpy as np
+        FP = Feature_Preprocessor(matrix, True, False)
+        self.keep = np.array([ i not in FP.unseen for i in xrange(len(matrix[0])) ])
+        self.mu = np.asarray(FP.mu_v)
+        self.sigma = np.asarray(FP.sigma_v)
+
+    def normalize(self, rows):
+        import numpy as np
+        rows = np.asarray(rows, dtype=float)[:, self.keep]
+        return (rows - self.mu) / self.sigma
+
+
+class Streaming_Feature_Preprocessor:
+    """
+        Same pre-processing as Feature_Preprocessor, for training sets too large for memory.
+        Instead of a matrix it takes _chunks_: a function that returns a new iterator over the rows
+            in chunks (lists of rows), for example blog_feature_chunks.
+        Fitting reads the chunks once (twice with pca):
+            - pruning and the z-score parameters with a running mean and variance
+            - incremental PCA
+        Transforming is done chunk by chunk, optionally into a memmap file.
+    """
+    def __init__(self, chunks, centralize=True, pca=True, components=30):
+        import numpy as np
+
+        self.rows = 0
+        mean = None
+        m2 = None
+        seen = None
+        for chunk in chunks():
+            chunk = np.asarray(chunk, dtype=float)
+            if mean is None:
+                mean = np.zeros(chunk.shape[1])
+                m2 = np.zeros(chunk.shape[1])
+                seen = np.zeros(chunk.shape[1], dtype=bool)
+            seen |= (chunk != 0.0).any(0)
+
+            # Merge the mean and sum of squared deviations of this chunk with the running ones (Chan et al.)
+            n = len(chunk)
+            chunk_mean = chunk.mean(0)
+            chunk_m2 = ((chunk - chunk_mean) ** 2).sum(0)
+            total = self.rows + n
+            delta = chunk_mean - mean
+            mean = mean + delta * n / total
+            m2 = m2 + chunk_m2 + delta ** 2 * self.rows * n / total
+            self.rows = total
+
+        self.keep = np.flatnonzero(seen)
+        self.unseen = set(np.flatnonzero(~seen))
+        self.centralized = centralize
+        if centralize:
+            self.mu_v = mean[self.keep]
+            sigma_v = np.sqrt(m2[self.keep] / self.rows)
+            sigma_v[sigma_v == 0] = sys.float_info.epsilon
+            self.sigma_v = sigma_v
+
+        self.analizer = None
+        if pca:
+            self.set_pca_params(chunks, components)
+
+    def set_pca_params(self, chunks, components):
+        import numpy as np
+        from sklearn.decomposition import IncrementalPCA
+        self.analizer = IncrementalPCA(n_components=components)
+
+        # Like Feature_Preprocessor, the PCA is learned on the pruned (not centralized) rows.
+        # partial_fit needs at least _components_ rows per call, so small chunks are combined,
+        #   and each batch is held back one step so a small remainder can be added to the last one.
+        ready = None
+        pending = []
+        for chunk in chunks():
+            pending.append(np.asarray(chunk, dtype=float)[:, self.keep])
+            if sum([ len(p) for p in pending ]) >= components:
+                if ready is not None:
+                    self.analizer.partial_fit(ready)
+                ready = np.vstack(pending)
+                pending = []
+        if ready is not None:
+            pending = [ready] + pending
+        self.analizer.partial_fit(np.vstack(pending))
+
+    def transform(self, chunk):
+        import numpy as np
+        chunk = np.asarray(chunk, dtype=float)[:, self.keep]
+        if self.centralized:
+            chunk = (chunk - self.mu_v) / self.sigma_v
+        if self.analizer is not None:
+            chunk = self.analizer.transform(chunk)
+        return chunk
+
+    def batch_normalize(self, matrix):
+        return self.transform(matrix)
+
+    def normalize(self, vector):
+        return self.transform([vector])[0]
+
+    def transform_to_file(self, chunks, filename):
+        """
+            Transforms all rows of _chunks_ into a memmap file, returns the (read-only) memmap.
+        """
+        import numpy as np
+        if self.analizer is not None:
+            width = self.analizer.n_components_
+        else:
+            width = len(self.keep)
+
+        out = np.memmap(filename, dtype='float64', mode='w+', shape=(self.rows, width))
+        row = 0
+        for chunk in chunks():
+            chunk = self.transform(chunk)
+            out[row:row + len(chunk)] = chunk
+            row += len(chunk)
+        out.flush()
+        del out
+        return np.memmap(filename, dtype='float64', mode='r', shape=(self.rows, width))
+
+
+def blog_feature_chunks(filename, features=False, chunk_size=10000, keys=False):
+    """
+        Returns a function that iterates over the feature vectors in a blog feature cache
+            (as made by feature_extraction.create_cached_features_blog, or a block container of it,
+            see block_store.convert_shelve), in chunks of _chunk_size_ rows.
+        With _features_ only those feature groups are selected, as in att_classify.data_select_specific_features.
+        With _keys_ every chunk comes as (keys, rows), with an (author, post number) key per row.
+    """
+    import shelve
+    from itertools import chain
+    from feature_extraction.block_store import is_block_file, Block_Reader
+
+    def blog_items(blogs):
+        if isinstance(blogs, Block_Reader):
+            return blogs.items()     # Sorted by author, one pass over the blocks
+        return ( (author, blogs[author]) for author in sorted(blogs.keys()) )
+
+    def chunks():
+        blogs = Block_Reader(filename) if is_block_file(filename) else shelve.open(filename, 'r')
+        chunk = []
+        chunk_keys = []
+        try:
+            for author, (info, texts) in blog_items(blogs):
+                for i, (f, d) in enumerate(texts):
+                    if features == False:
+                        chunk.append(f)
+                    else:
+                        chunk.append(list(chain(*[ d[n] for n in features ])))
+                    chunk_keys.append((author, i))
+                    if len(chunk) == chunk_size:
+                        yield (chunk_keys, chunk) if keys else chunk
+                        chunk = []
+                        chunk_keys = []
+            if chunk:
+                yield (chunk_keys, chunk) if keys else chunk
+        finally:
+            blogs.close()
+    return chunks
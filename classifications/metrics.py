@@ -0,0 +1,200 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    Evaluation metrics over numpy arrays.
+    A rank is the position of the actual author in the ranking of a prediction, 0 being the top.
+    The precision (or recall, there is one answer per text) at rank i is the fraction of ranks <= i,
+        which is the cumulative histogram of the ranks.
+    Metrics_Accumulator keeps only the histogram and the confusion counts,
+        so the results of many folds can be added up without keeping the predictions.
+"""
+
+import numpy as np
+
+
+def precision_at_ranks(ranks, setsize):
+    """
+        The precision at each rank 0.._setsize_-1
+    """
+    ranks = np.asarray(ranks, dtype=int)
+    counts = np.bincount(ranks, minlength=setsize)[:setsize]
+    return (np.cumsum(counts) / float(len(ranks))).tolist()
+
+
+def top_k_accuracy(ranks, k):
+    """
+        The fraction of texts whose actual author is among the first _k_
+    """
+    ranks = np.asarray(ranks, dtype=int)
+    return (ranks < k).sum() / float(len(ranks))
+
+
+def accuracy(predictions, classes):
+    """
+        The relative number of correct predictions
+    """
+    return (np.asarray(predictions) == np.asarray(classes)).sum() / float(len(classes))
+
+
+def ranks_from_scores(scores, labels, actual):
+    """
+        The rank of the actual author of every row of _scores_ (one column per label in _labels_, higher is better).
+        Equal scores are ordered as the labels are, like a stable sort on the scores does.
+    """
+    scores = np.asarray(scores)
+    index = dict([ (l, i) for i, l in enumerate(labels) ])
+    columns = np.array([ index[a] for a in actual ])
+    rows = np.arange(len(columns))
+    true_scores = scores[rows, columns][:, None]
+    before = np.arange(scores.shape[1])[None, :] < columns[:, None]
+    return ((scores > true_scores) | ((scores == true_scores) & before)).sum(1)
+
+
+def confusion_matrix(predictions, classes, labels=None):
+    """
+        Returns (labels, matrix), matrix[i, j] is the number of texts of labels[i] that were attributed to labels[j]
+    """
+    accumulator = Metrics_Accumulator(labels if labels is not None else ())
+    accumulator.add_predictions(predictions, classes)
+    return accumulator.confusion_matrix()
+
+
+def per_author_stats(predictions, classes):
+    """
+        {author: (precision, recall, f1, support)}
+    """
+    accumulator = Metrics_Accumulator()
+    accumulator.add_predictions(predictions, classes)
+    return accumulator.per_author()
+
+
+class Metrics_Accumulator:
+    """
+        Adds up ranks and predictions of any number of folds.
+        Labels are given codes in the order they are first seen (or in the order of _labels_).
+    """
+    def __init__(self, labels=()):
+        self.labels = []
+        self.label_index = dict()
+        self.confusion = np.zeros((0, 0), dtype=np.int64)
+        self.rank_counts = np.zeros(0, dtype=np.int64)
+        self.add_labels(labels)
+
+    def add_labels(self, labels):
+        for l in labels:
+            if l not in self.label_index:
+                self.label_index[l] = len(self.labels)
+                self.labels.append(l)
+        n = len(self.labels)
+        if n > self.confusion.shape[0]:
+            grown = np.zeros((n, n), dtype=np.int64)
+            grown[:self.confusion.shape[0], :self.confusion.shape[1]] = self.confusion
+            self.confusion = grown
+
+    def add_ranks(self, ranks):
+        self.add_rank_counts(np.bincount(np.asarray(ranks, dtype=int)))
+
+    def add_rank_counts(self, counts):
+        """
+            Adds a histogram of ranks (counts[i] texts at rank i)
+        """
+        if len(counts) > len(self.rank_counts):
+            grown = np.zeros(len(counts), dtype=np.int64)
+            grown[:len(self.rank_counts)] = self.rank_counts
+            self.rank_counts = grown
+        self.rank_counts[:len(counts)] += counts
+
+    def add_predictions(self, predictions, classes):
+        # Only the distinct labels of the batch go through python
+        batch_labels, codes = np.unique(np.concatenate([np.asarray(classes), np.asarray(predictions)]), return_inverse=True)
+        self.add_labels(batch_labels.tolist())
+        codes = np.array([ self.label_index[l] for l in batch_labels.tolist() ], dtype=int)[codes]
+        actual, predicted = codes[:len(classes)], codes[len(classes):]
+        n = len(self.labels)
+        self.confusion += np.bincount(actual * n + predicted, minlength=n * n).reshape(n, n)
+
+    def merge(self, other):
+        """
+            Adds the counts of another accumulator, for example one of a worker process
+        """
+        self.add_rank_counts(other.rank_counts)
+        self.add_labels(other.labels)
+        codes = np.array([ self.label_index[l] for l in other.labels ], dtype=int)
+        self.confusion[np.ix_(codes, codes)] += other.confusion
+
+    def precision_at_ranks(self, setsize=None):
+        if setsize is None:
+            setsize = max(len(self.labels), len(self.rank_counts))
+        counts = np.zeros(setsize, dtype=np.int64)
+        used = min(setsize, len(self.rank_counts))
+        counts[:used] = self.rank_counts[:used]
+        return (np.cumsum(counts) / float(self.rank_counts.sum())).tolist()
+
+    def top_k_accuracy(self, k):
+        return self.rank_counts[:k].sum() / float(self.rank_counts.sum())
+
+    def accuracy(self):
+        return np.trace(self.confusion) / float(self.confusion.sum())
+
+    def confusion_matrix(self):
+        return list(self.labels), self.confusion.copy()
+
+    def per_author(self):
+        """
+            {author: (precision, recall, f1, support)}, authors that were never predicted have precision 0
+        """
+        correct = np.diag(self.confusion).astype(float)
+        support = self.confusion.sum(1)
+        predicted = self.confusion.sum(0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(predicted > 0, correct / predicted, 0.0)
+            recall = np.where(support > 0, correct / support, 0.0)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        return dict([ (l, (precision[i], recall[i], f1[i], support[i])) for i, l in enumerate(self.labels) ])
+
+
+def roc_auc(scores, positives):
+    """
+        Area under the ROC curve of _scores_ (higher means positive) for the boolean labels _positives_,
+            as the Mann-Whitney statistic, ties count half
+    """
+    scores = np.asarray(scores, dtype=float)
+    positives = np.asarray(positives, dtype=bool)
+    order = np.argsort(scores, kind='mergesort')
+    ranks = np.empty(len(scores))
+    ranks[order] = np.arange(1, len(scores) + 1)
+    # Equal scores get their average rank
+    _, inverse = np.unique(scores, return_inverse=True)
+    ranks = (np.bincount(inverse, ranks) / np.bincount(inverse))[inverse]
+    p = positives.sum()
+    n = len(scores) - p
+    return (ranks[positives].sum() - p * (p + 1) / 2.0) / (p * n)
+
+
+def equal_error_rate(scores, positives):
+    """
+        Returns (rate, threshold) where the false acceptance rate (negatives scoring >= threshold)
+            and the false rejection rate (positives scoring < threshold) are closest
+    """
+    scores = np.asarray(scores, dtype=float)
+    positives = np.asarray(positives, dtype=bool)
+    genuine = np.sort(scores[positives])
+    impostor = np.sort(scores[~positives])
+    thresholds = np.unique(scores)
+    far = 1.0 - np.searchsorted(impostor, thresholds, 'left') / float(len(impostor))
+    frr = np.searchsorted(genuine, thresholds, 'left') / float(len(genuine))
+    i = np.abs(far - frr).argmin()
+    return (far[i] + frr[i]) / 2.0, thresholds[i]
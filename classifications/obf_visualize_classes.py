@@ -13,7 +13,17 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from helper_classes import Feature_Preprocessor
+"""
+    Plots the texts of interest (obfuscated) against the natural texts on the first two principal components.
+    The projection is fitted on a stratified subsample and applied to all rows in numpy batches.
+    Small sets are drawn as a scatter plot, large sets as 2-D histograms (log density) per class.
+    The plots are written as PNG files with the Agg backend, no display is needed.
+"""
+
+from random import Random
+
+import numpy as np
+
 from att_classify import data_select_specific_features, name_has_substring
 
 def get_feature_vectors_from_data(data, interest=['obfuscation'], exclude=['verification','imitation']):
@@ -33,47 +43,144 @@ def get_feature_vectors_from_data(data, interest=['obfuscation'], exclude=['veri
 
     return set_f, set_c
 
-if __name__ == '__main__':
+def stratified_subsample(classes, size, seed=1, min_per_class=500):
+    """
+        Indexes of about _size_ rows with the classes in the same proportions,
+            but at least _min_per_class_ rows of every class (or all of them), so rare classes stay visible.
+    """
+    by_class = dict()
+    for i, c in enumerate(classes):
+        by_class.setdefault(c, []).append(i)
+    if len(classes) <= size:
+        return range(len(classes))
+    random = Random(seed)
+    indexes = []
+    for c in sorted(by_class.keys()):
+        rows = by_class[c]
+        quota = max(min_per_class, int(round(size * len(rows) / float(len(classes)))))
+        indexes += random.sample(rows, min(quota, len(rows)))
+    return sorted(indexes)
+
+
+class Projection:
+    """
+        Pruning and PCA as Feature_Preprocessor(features, False, True, 2), fitted on a sample of the rows
+            and applied to whole batches at once.
+    """
+    def __init__(self, sample, components=2):
+        from sklearn.decomposition import PCA
+        sample = np.asarray(sample, dtype=float)
+        self.keep = (sample != 0.0).any(0)
+        self.pca = PCA(n_components=components)
+        self.pca.fit(sample[:, self.keep])
+
+    def transform(self, rows, batch_size=100000):
+        rows = np.asarray(rows, dtype=float)
+        points = np.empty((len(rows), self.pca.n_components))
+        for i in xrange(0, len(rows), batch_size):
+            points[i:i + batch_size] = self.pca.transform(rows[i:i + batch_size, self.keep])
+        return points
+
+
+def pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
     from matplotlib import pyplot as plt
-    print "Loading data.."
-    from feature_extraction.Cached_Features import data
-    print "Normalizing..."
+    return plt
 
-    # Select features
-    data = data_select_specific_features(data, ['bi_char_dist', 'legomena', 'word_length', 'tri_char_dist', 'mono_tag_dist', 'sentence_length', 'readability'])
 
-    # Get the data separated in features and classes
-    features, classes = get_feature_vectors_from_data(data)
+def scatter_plot(points, classes, filename, labels=('Natural', 'Obfuscated')):
+    plt = pyplot()
+    classes = np.asarray(classes)
+    normal = points[classes == 0]
+    interest = points[classes == 1]
+
+    plt.figure(figsize=(12, 9))
+    norml = plt.scatter(normal[:, 0], normal[:, 1], marker='x', c='b', s=40)
+    inter = plt.scatter(interest[:, 0], interest[:, 1], marker='o', c='r', s=40)
 
-    # Compres the features to two numbers (points)
-    FP = Feature_Preprocessor(features, False, True, 2)
-    features = FP.batch_normalize(features)
+    plt.ylabel('Principal Component #2', fontsize=24)
+    plt.xlabel('Principal Component #1', fontsize=24)
+    plt.legend((norml, inter), labels, scatterpoints=1, loc='lower right', ncol=1, fontsize=28)
+    plt.savefig(filename, dpi=100)
+    plt.close()
 
 
-    print "Data processed, now plotting..."
+def density_plot(points, classes, filename, bins=300, labels=('Natural', 'Obfuscated')):
+    """
+        One log density panel per class, on the same (outlier clipped) axes
+    """
+    plt = pyplot()
+    classes = np.asarray(classes)
+    low = np.percentile(points, 0.5, axis=0)
+    high = np.percentile(points, 99.5, axis=0)
+    extent = [(low[0], high[0]), (low[1], high[1])]
+    present = [ c for c in [0, 1] if (classes == c).any() ]
+
+    figure, axes = plt.subplots(1, len(present), figsize=(9 * len(present), 8), squeeze=False)
+    for ax, c in zip(axes[0], present):
+        selected = points[classes == c]
+        counts, xedges, yedges = np.histogram2d(selected[:, 0], selected[:, 1], bins=bins, range=extent)
+        ax.imshow(np.log1p(counts.T), origin='lower', aspect='auto', cmap='Blues' if c == 0 else 'Reds',
+                  extent=[xedges[0], xedges[-1], yedges[0], yedges[-1]])
+        ax.set_title("%s (%d)" % (labels[c], len(selected)), fontsize=20)
+        ax.set_xlabel('Principal Component #1', fontsize=16)
+        ax.set_ylabel('Principal Component #2', fontsize=16)
+    figure.savefig(filename, dpi=100)
+    plt.close(figure)
+
+
+def visualize(features, classes, filename, sample_size=20000, scatter_limit=5000):
+    """
+        Projects all rows with a projection fitted on a stratified subsample and writes the plot to _filename_
+    """
+    projection = Projection([ features[i] for i in stratified_subsample(classes, sample_size) ])
+    points = projection.transform(features)
+    if len(points) <= scatter_limit:
+        scatter_plot(points, classes, filename)
+    else:
+        density_plot(points, classes, filename)
+    return points
 
-    # Convert a list of points to two lists of x and y points (fortran style)
-    x = [ p[0] for p in features ]
-    y = [ p[1] for p in features ]
 
-    # Split into points of interest and normal points (obfuscated texts ad natural texts)
-    interest = [ p for p in zip(x,y,classes) if p[2] == 1 ]
-    normal = [ p for p in zip(x,y,classes) if p[2] == 0 ]
+def visualize_blog_cache(cache, filename, features=False, sample_size=20000, seed=1):
+    """
+        Density plot of all posts of a blog feature cache (one class), read in chunks twice:
+            once for a uniform (reservoir) sample to fit the projection on, once to project.
+    """
+    from helper_classes import blog_feature_chunks
+    chunks = blog_feature_chunks(cache, features)
+
+    random = Random(seed)
+    sample = []
+    seen = 0
+    for chunk in chunks():
+        for row in chunk:
+            seen += 1
+            if len(sample) < sample_size:
+                sample.append(row)
+            else:
+                j = random.randrange(seen)
+                if j < sample_size:
+                    sample[j] = row
+    projection = Projection(sample)
+    points = np.concatenate([ projection.transform(chunk) for chunk in chunks() ])
+    density_plot(points, np.zeros(len(points), dtype=int), filename, labels=('Blog posts',))
+    return points
 
-    # scatterplot the points
-    norml = plt.scatter(zip(*normal)[0], zip(*normal)[1], marker='x', c='b', s=40)
-    inter = plt.scatter(zip(*interest)[0], zip(*interest)[1], marker='o', c='r', s=40)
 
-    # Some metaplots and show
-    plt.ylabel('Principal Component #2', fontsize=24)
-    plt.xlabel('Principal Component #1', fontsize=24)
+if __name__ == '__main__':
+    print "Loading data.."
+    from feature_extraction.feature_store import load_features
+    data = load_features()
+    print "Normalizing..."
 
-    plt.legend((norml, inter),
-               ('Natural', 'Obfuscated'),
-               scatterpoints=1,
-               loc='lower right',
-               ncol=1,
-               fontsize=28)
+    # Select features
+    data = data_select_specific_features(data, ['bi_char_dist', 'legomena', 'word_length', 'tri_char_dist', 'mono_tag_dist', 'sentence_length', 'readability'])
 
-    plt.show()
+    # Get the data separated in features and classes
+    features, classes = get_feature_vectors_from_data(data)
 
+    print "Plotting..."
+    visualize(features, classes, "obf_classes.png")
+    print "Written to obf_classes.png"
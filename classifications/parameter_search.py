@@ -0,0 +1,288 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    Hyperparameter search for the classifiers of att_classifiers.
+    Every fold is normalized once, and the distance matrices of a fold are computed once,
+        then shared by all parameter values:
+        - svm: the rbf kernel is exp(-gamma * squared distances), fitted as a precomputed kernel
+        - knn: the neighbours are sorted once (L1 distance), every n_neighbors reuses that order
+        - adaboost: one fit with the most estimators, staged predictions give all smaller n_estimators
+    Trials run in parallel over folds, the results are written as a tab separated table.
+"""
+
+import itertools
+from math import ceil
+from random import Random
+from time import time
+
+import numpy as np
+
+from helper_classes import Feature_Preprocessor
+from att_classifiers import CLASSIFIERS
+
+# gamma is given relative to the number of features, as in att_classifiers: gamma = gamma_scale / len(features[0])
+GRIDS = {
+    'svm': {'C': [0.5, 1.0, 2.4, 5.0, 10.0, 20.0], 'gamma_scale': [0.1, 0.3, 0.7, 1.5, 3.0]},
+    'knn': {'n_neighbors': range(1, 16)},
+    'adaboost': {'n_estimators': [5, 10, 20, 40, 80, 160], 'learning_rate': [0.5, 0.998]},
+}
+
+
+class Fold:
+    """
+        One normalized fold, with its distance matrices computed on first use.
+    """
+    def __init__(self, ((inset_f, inset_c), (outset_f, outset_c)), preprocessing):
+        FP = Feature_Preprocessor(inset_f, *preprocessing)
+        self.train = np.asarray(FP.batch_normalize(inset_f), dtype=float)
+        self.test = np.asarray(FP.batch_normalize(outset_f), dtype=float)
+        self.train_c = np.asarray(inset_c)
+        self.test_c = np.asarray(outset_c)
+        self.cache = dict()
+
+    def squared_distances(self):
+        # (train x train, test x train) squared euclidean distances
+        if 'sq' not in self.cache:
+            def sq(a, b):
+                d = (a ** 2).sum(1)[:, None] + (b ** 2).sum(1)[None, :] - 2 * np.dot(a, b.T)
+                return np.maximum(d, 0)
+            self.cache['sq'] = (sq(self.train, self.train), sq(self.test, self.train))
+        return self.cache['sq']
+
+    def neighbours(self):
+        # L1 distances from each test row to each training row, and the training rows sorted by it
+        if 'l1' not in self.cache:
+            distances = np.abs(self.test[:, None, :] - self.train[None, :, :]).sum(2)
+            self.cache['l1'] = (distances, np.argsort(distances, axis=1, kind='mergesort'))
+        return self.cache['l1']
+
+
+def svm_scores(fold, configs):
+    from sklearn.svm import SVC
+
+    train_sq, test_sq = fold.squared_distances()
+    n_features = fold.train.shape[1]
+    scores = []
+    kernels = dict()
+    for config in configs:
+        gamma = config['gamma_scale'] / n_features
+        if gamma not in kernels:
+            kernels[gamma] = (np.exp(-gamma * train_sq), np.exp(-gamma * test_sq))
+        train_k, test_k = kernels[gamma]
+        clf = SVC(kernel='precomputed', C=config['C'])
+        clf.fit(train_k, fold.train_c)
+        scores.append((clf.predict(test_k) == fold.test_c).sum())
+    return scores
+
+
+def knn_scores(fold, configs):
+    """
+        Distance weighted voting as KNeighborsClassifier(weights='distance', p=1) does it,
+            for all n_neighbors from one sorting of the neighbours.
+    """
+    distances, order = fold.neighbours()
+    classes, codes = np.unique(fold.train_c, return_inverse=True)
+    rows = np.arange(len(order))[:, None]
+    scores = []
+    for config in configs:
+        nearest = order[:, :config['n_neighbors']]
+        d = distances[rows, nearest]
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / d
+        # Exact matches get all the weight
+        exact = (d == 0).any(1)
+        weights[exact] = (d[exact] == 0)
+        votes = np.zeros((len(order), len(classes)))
+        for j in xrange(nearest.shape[1]):
+            votes[rows[:, 0], codes[nearest[:, j]]] += weights[:, j]
+        scores.append((classes[votes.argmax(1)] == fold.test_c).sum())
+    return scores
+
+
+def adaboost_scores(fold, configs):
+    from sklearn.ensemble import AdaBoostClassifier
+
+    scores = [ None for _ in configs ]
+    by_rate = dict()
+    for i, config in enumerate(configs):
+        by_rate.setdefault(config['learning_rate'], []).append(i)
+    for rate, indexes in by_rate.items():
+        most = max([ configs[i]['n_estimators'] for i in indexes ])
+        clf = AdaBoostClassifier(n_estimators=most, learning_rate=rate, algorithm='SAMME.R', random_state=1)
+        clf.fit(fold.train, fold.train_c)
+        staged = list(clf.staged_predict(fold.test))
+        for i in indexes:
+            # Boosting can stop early, then the last stage is the final model
+            prediction = staged[min(configs[i]['n_estimators'], len(staged)) - 1]
+            scores[i] = (prediction == fold.test_c).sum()
+    return scores
+
+SCORERS = {'svm': svm_scores, 'knn': knn_scores, 'adaboost': adaboost_scores}
+
+# The folds, set before the worker pool is started so the workers share them (fork)
+FOLDS = []
+
+
+def score_task((method, configs, fold_index)):
+    fold = FOLDS[fold_index]
+    start = time()
+    scores = SCORERS[method](fold, configs)
+    return fold_index, scores, len(fold.test_c), time() - start
+
+
+class Search:
+    """
+        Evaluates parameter configurations of one method on cached folds.
+        Results are remembered per (configuration, fold), so later rounds only compute what is new.
+    """
+    def __init__(self, sets, method, processes=1):
+        global FOLDS
+        self.method = method
+        FOLDS = [ Fold(s, CLASSIFIERS[method][0]) for s in sets ]
+        self.folds = FOLDS
+        self.processes = processes
+        self.results = dict()   # (config key, fold) -> (correct, total, seconds)
+
+        # Compute the distance matrices here, so that all workers share them
+        for fold in FOLDS:
+            if method == 'svm':
+                fold.squared_distances()
+            elif method == 'knn':
+                fold.neighbours()
+
+        if processes > 1:
+            from multiprocessing import Pool
+            self.pool = Pool(processes)
+            self.map = self.pool.map
+        else:
+            self.map = map
+
+    def close(self):
+        if self.processes > 1:
+            self.pool.close()
+            self.pool.join()
+
+    def evaluate(self, configs, folds):
+        """
+            Make sure every config in _configs_ is evaluated on every fold in _folds_
+        """
+        tasks = []
+        for fold in folds:
+            todo = [ c for c in configs if (config_key(c), fold) not in self.results ]
+            if todo:
+                tasks.append((self.method, todo, fold))
+        for (method, todo, _), (fold, scores, total, seconds) in zip(tasks, self.map(score_task, tasks)):
+            for config, correct in zip(todo, scores):
+                self.results[(config_key(config), fold)] = (correct, total, seconds / len(todo))
+
+    def precision(self, config, folds):
+        correct = sum([ self.results[(config_key(config), f)][0] for f in folds ])
+        total = sum([ self.results[(config_key(config), f)][1] for f in folds ])
+        return correct / float(total)
+
+    def table(self, configs, folds):
+        """
+            Rows of (config, folds, precision, seconds), best first
+        """
+        rows = []
+        for config in configs:
+            done = [ f for f in folds if (config_key(config), f) in self.results ]
+            seconds = sum([ self.results[(config_key(config), f)][2] for f in done ])
+            rows.append((config, len(done), self.precision(config, done), seconds))
+        return sorted(rows, key=lambda x : (x[1], x[2]), reverse=True)
+
+
+def config_key(config):
+    return tuple(sorted(config.items()))
+
+
+def grid_configs(grid):
+    names = sorted(grid.keys())
+    return [ dict(zip(names, values)) for values in itertools.product(*[ grid[n] for n in names ]) ]
+
+
+def grid_search(search, grid):
+    configs = grid_configs(grid)
+    folds = range(len(search.folds))
+    search.evaluate(configs, folds)
+    return search.table(configs, folds)
+
+
+def random_search(search, grid, trials=20, seed=1):
+    configs = grid_configs(grid)
+    configs = Random(seed).sample(configs, min(trials, len(configs)))
+    folds = range(len(search.folds))
+    search.evaluate(configs, folds)
+    return search.table(configs, folds)
+
+
+def successive_halving(search, grid, min_folds=1, eta=2):
+    """
+        Evaluates all configurations on _min_folds_ folds, keeps the best 1/_eta_,
+            and evaluates those on _eta_ times as many folds, until one remains or the folds run out.
+    """
+    configs = grid_configs(grid)
+    survivors = configs
+    n_folds = min_folds
+    while True:
+        folds = range(min(n_folds, len(search.folds)))
+        search.evaluate(survivors, folds)
+        if len(survivors) == 1 or len(folds) == len(search.folds):
+            break
+        ranked = sorted(survivors, key=lambda c : search.precision(c, folds), reverse=True)
+        survivors = ranked[:int(ceil(len(ranked) / float(eta)))]
+        n_folds *= eta
+    return search.table(configs, range(len(search.folds)))
+
+
+def write_table(rows, filename, method):
+    f = open(filename, 'w')
+    f.write("method\tparameters\tfolds\tprecision\tseconds\n")
+    for config, folds, precision, seconds in rows:
+        parameters = ",".join([ "%s=%s" % x for x in sorted(config.items()) ])
+        f.write("%s\t%s\t%d\t%.4f\t%.3f\n" % (method, parameters, folds, precision, seconds))
+    f.close()
+
+
+def search(sets, method, strategy='halving', grid=None, processes=1, filename=None, **kwargs):
+    """
+        Runs a parameter search for _method_ ('svm', 'knn' or 'adaboost') on _sets_.
+        _strategy_ is 'grid', 'random' or 'halving'. Returns the result rows, best first.
+    """
+    if grid is None:
+        grid = GRIDS[method]
+    s = Search(sets, method, processes)
+    try:
+        strategies = {'grid': grid_search, 'random': random_search, 'halving': successive_halving}
+        rows = strategies[strategy](s, grid, **kwargs)
+    finally:
+        s.close()
+    if filename is not None:
+        write_table(rows, filename, method)
+    return rows
+
+
+if __name__ == '__main__':
+    from att_classify import create_splits, data_select_specific_features
+    from feature_extraction.feature_store import load_features
+    print "Loading data.."
+    data = data_select_specific_features(load_features())
+    print "Working..."
+
+    sets = create_splits(data, samples=10, splits_per_sample=2)
+    for method in ['knn', 'svm', 'adaboost']:
+        rows = search(sets, method, 'halving', processes=4, filename="search_" + method + ".tsv")
+        print method, "best:", rows[0]
@@ -0,0 +1,168 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    A read-only data set shared between processes.
+    The feature matrix, the author of each row and the story type of each row are written once
+        to memmapped files (in /dev/shm when it exists, so they live in shared memory).
+    Worker processes attach by name and read the same pages, nothing is copied or pickled,
+        so the memory per worker stays the same no matter how many workers there are.
+"""
+
+import os, json, tempfile
+
+import numpy as np
+
+from att_classify import name_has_substring
+
+STORY_TYPES = ['natural', 'obfuscation', 'imitation', 'verification']
+
+# Data sets this process has attached to, by name
+ATTACHED = dict()
+
+
+def default_directory():
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def story_type(story):
+    for i in xrange(1, len(STORY_TYPES)):
+        if name_has_substring(story, [STORY_TYPES[i]]):
+            return i
+    return 0
+
+
+class Shared_Dataset:
+    """
+        Rows are ordered by (author, story). Use create in the parent process and attach in the workers.
+    """
+    def __init__(self, name, directory):
+        path = os.path.join(directory, name)
+        f = open(path + ".json")
+        meta = json.load(f)
+        f.close()
+
+        self.name = name
+        self.directory = directory
+        self.authors = meta['authors']
+        self.stories = meta['stories']
+        rows, columns = meta['shape']
+        self.features = np.memmap(path + ".features", dtype='float64', mode='r', shape=(rows, columns))
+        self.author_codes = np.memmap(path + ".authors", dtype='int32', mode='r', shape=(rows,))
+        self.type_codes = np.memmap(path + ".types", dtype='int8', mode='r', shape=(rows,))
+
+    @staticmethod
+    def create(data, name, directory=None):
+        """
+            Writes _data_ ({author: {story: feature vector}}, see att_classify.data_select_specific_features)
+                to the shared files of _name_, returns the attached data set.
+        """
+        if directory is None:
+            directory = default_directory()
+        path = os.path.join(directory, name)
+
+        authors = sorted(data.keys())
+        stories = [ (a, s) for a in authors for s in sorted(data[a].keys()) ]
+        columns = len(data[authors[0]].values()[0])
+
+        features = np.memmap(path + ".features", dtype='float64', mode='w+', shape=(len(stories), columns))
+        author_codes = np.memmap(path + ".authors", dtype='int32', mode='w+', shape=(len(stories),))
+        type_codes = np.memmap(path + ".types", dtype='int8', mode='w+', shape=(len(stories),))
+        author_index = dict([ (a, i) for i, a in enumerate(authors) ])
+        for row, (a, s) in enumerate(stories):
+            features[row] = data[a][s]
+            author_codes[row] = author_index[a]
+            type_codes[row] = story_type(s)
+        for m in [features, author_codes, type_codes]:
+            m.flush()
+        del features, author_codes, type_codes
+
+        # The metadata is written last, so a half written data set can't be attached
+        f = open(path + ".json.tmp", 'w')
+        json.dump({'authors': authors, 'stories': [ s for _, s in stories ], 'shape': [len(stories), columns]}, f)
+        f.close()
+        os.rename(path + ".json.tmp", path + ".json")
+
+        return attach(name, directory)
+
+    def rows(self, indexes):
+        """
+            Features and author names of the rows in _indexes_ (only these rows are copied)
+        """
+        indexes = np.asarray(indexes, dtype=int)
+        return self.features[indexes], [ self.authors[c] for c in self.author_codes[indexes] ]
+
+    def fold(self, train, test):
+        """
+            A fold in the ((inset_f, inset_c), (outset_f, outset_c)) form of att_classify.create_splits
+        """
+        return self.rows(train), self.rows(test)
+
+    def select(self, types=('natural',)):
+        """
+            Indexes of the rows of the given story types
+        """
+        codes = [ STORY_TYPES.index(t) for t in types ]
+        return np.flatnonzero(np.in1d(self.type_codes, codes))
+
+    def remove(self):
+        path = os.path.join(self.directory, self.name)
+        for extension in [".json", ".features", ".authors", ".types"]:
+            if os.path.exists(path + extension):
+                os.remove(path + extension)
+        ATTACHED.pop((self.name, self.directory), None)
+
+
+def attach(name, directory=None):
+    """
+        Opens the shared data set _name_, once per process.
+    """
+    if directory is None:
+        directory = default_directory()
+    if (name, directory) not in ATTACHED:
+        ATTACHED[(name, directory)] = Shared_Dataset(name, directory)
+    return ATTACHED[(name, directory)]
+
+
+def evaluate_shared_fold((name, directory, train, test, names)):
+    from att_classify import evaluate_fold
+    dataset = attach(name, directory)
+    return evaluate_fold(dataset.fold(train, test), names)
+
+
+def cross_validate_shared(dataset, folds, names, processes=1):
+    """
+        att_classify.cross_validate_methods for a Shared_Dataset.
+        _folds_ are (train indexes, test indexes) pairs, only those indexes are sent to the workers.
+    """
+    tasks = [ (dataset.name, dataset.directory, train, test, names) for train, test in folds ]
+    if processes > 1:
+        from multiprocessing import Pool
+        pool = Pool(processes)
+        fold_predictions = pool.map(evaluate_shared_fold, tasks)
+        pool.close()
+        pool.join()
+    else:
+        fold_predictions = map(evaluate_shared_fold, tasks)
+
+    results = dict([ (name, ([], [])) for name in names ])
+    for (train, test), predictions in zip(folds, fold_predictions):
+        classes = dataset.rows(test)[1]
+        for name in names:
+            results[name][0].extend(predictions[name])
+            results[name][1].extend(classes)
+    return results
@@ -0,0 +1,180 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    Lazy, random access learn-test splits.
+    A split generator gives folds as (train indexes, test indexes) into its rows,
+        the (author, story) pairs of the data sorted by author and story (the row order of shared_dataset.Shared_Dataset).
+    Fold i can be made on its own, in any process: every sample of authors draws from its own random stream,
+        seeded from (seed, sample number) in the same way on every machine.
+    With _compat_ the folds are exactly those of the old att_classify.create_splits(_attack), which drew every sample
+        from one stream in sequence. Then a fold is made by replaying that stream up to its sample
+        (sequential access only replays once).
+"""
+
+import hashlib
+from random import Random
+
+
+def derived_seed(seed, sample):
+    """
+        The seed of the random stream of one sample, the same on every machine and python build
+    """
+    return int(hashlib.sha1("%d/%d" % (seed, sample)).hexdigest()[:15], 16)
+
+
+def name_has_substring(name, substrings):
+    """
+        Checks if a name contains one of many substrings
+    """
+    for elem in substrings:
+        if elem in name:
+            return True
+    return False
+
+
+class Split_Generator:
+    """
+        Base class, subclasses define __len__ and members(i): the (author, story) pairs of the train and test set of fold i.
+    """
+    def __init__(self, data, seed=1, compat=False):
+        self.seed = seed
+        self.compat = compat
+        self.rows = [ (a, s) for a in sorted(data.keys()) for s in sorted(data[a].keys()) ]
+        self.row_index = dict([ (r, i) for i, r in enumerate(self.rows) ])
+
+    def sample_random(self, sample):
+        return Random(derived_seed(self.seed, sample))
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("fold out of range")
+        train, test = self.members(i)
+        return [ self.row_index[r] for r in train ], [ self.row_index[r] for r in test ]
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def classes(self, indexes):
+        return [ self.rows[i][0] for i in indexes ]
+
+    def fold(self, i, data):
+        """
+            Fold _i_ with the features of _data_, in the ((inset_f, inset_c), (outset_f, outset_c)) form
+        """
+        train, test = self.members(i)
+        return ([ data[a][s] for a, s in train ], [ a for a, _ in train ]), ([ data[a][s] for a, s in test ], [ a for a, _ in test ])
+
+    def sets(self, data):
+        return [ self.fold(i, data) for i in xrange(len(self)) ]
+
+
+class Natural_Splits(Split_Generator):
+    """
+        The splits of att_classify.create_splits: _samples_ times a selection of _num_authors_ authors,
+            each with _splits_per_sample_ folds that leave out one (shuffled) story per author.
+    """
+    def __init__(self, data, samples=2, num_authors=40, splits_per_sample=1, exclude=['verification', 'imitation', 'obfuscation'], seed=1, compat=False):
+        Split_Generator.__init__(self, data, seed, compat)
+        self.samples = samples
+        self.num_authors = num_authors
+        self.splits_per_sample = splits_per_sample
+
+        # The same dictionaries (and so the same iteration orders) as create_splits made
+        clean_stories = dict()
+        for author in data.keys():
+            clean_stories[author] = dict([ (k, None) for k in data[author].keys() if not name_has_substring(k, exclude) ])
+        assert min([len(x) for x in clean_stories.values()]) >= splits_per_sample, "More splits per sample than there are samples"
+        self.author_to_storylist = dict([ (a, sorted(clean_stories[a].keys())) for a in clean_stories.keys() ])
+        self.authors = sorted(clean_stories.keys())
+        self.replay = None
+
+    def __len__(self):
+        return self.samples * self.splits_per_sample
+
+    def sample(self, sample):
+        """
+            The authors of _sample_ in fold order, and the story order of each of them
+        """
+        if not self.compat:
+            random = self.sample_random(sample)
+            authors = random.sample(self.authors, self.num_authors)
+            orders = dict()
+            for a in sorted(authors):
+                orders[a] = list(self.author_to_storylist[a])
+                random.shuffle(orders[a])
+            return authors, orders
+
+        # One stream: first all samples of authors, then per sample a shuffle of the story lists of all authors
+        if self.replay is None or self.replay[0] > sample:
+            random = Random(self.seed)
+            subsets = [ random.sample(self.authors, self.num_authors) for _ in xrange(self.samples) ]
+            orders = dict([ (a, list(l)) for a, l in self.author_to_storylist.items() ])
+            self.replay = [-1, random, subsets, orders]
+        while self.replay[0] < sample:
+            random, orders = self.replay[1], self.replay[3]
+            # In the iteration order of author_to_storylist, a rebuilt dictionary may iterate differently
+            [ random.shuffle(orders[k]) for k in self.author_to_storylist.keys() ]
+            self.replay[0] += 1
+        subset = self.replay[2][sample]
+        return dict([ (k, None) for k in subset ]).keys(), self.replay[3]
+
+    def members(self, i):
+        sample, index = divmod(i, self.splits_per_sample)
+        authors, orders = self.sample(sample)
+        train, test = [], []
+        for author in authors:
+            for j, story in enumerate(orders[author]):
+                (test if j == index else train).append((author, story))
+        return train, test
+
+
+class Attack_Splits(Split_Generator):
+    """
+        The splits of att_classify.create_splits_attack: per sample _num_authors_ authors,
+            their attack texts are the test set, their other (not excluded) texts the training set.
+    """
+    def __init__(self, data, num_authors=40, samples=1, exclude=['verification', 'imitation'], attack=['obfuscation'], seed=1, compat=False):
+        Split_Generator.__init__(self, data, seed, compat)
+        self.samples = samples
+        self.num_authors = num_authors
+        self.authors = sorted(data.keys())
+        # Story order as create_splits_attack iterated them
+        self.stories = dict([ (a, [ s for s in data[a].keys() if not name_has_substring(s, exclude) ]) for a in data.keys() ])
+        if not compat:
+            for a in self.stories:
+                self.stories[a].sort()
+        self.attack = attack
+        self.subsets = None
+
+    def __len__(self):
+        return self.samples
+
+    def members(self, i):
+        if self.compat:
+            if self.subsets is None:
+                random = Random(self.seed)
+                self.subsets = [ random.sample(self.authors, self.num_authors) for _ in xrange(self.samples) ]
+            authors = self.subsets[i]
+        else:
+            authors = self.sample_random(i).sample(self.authors, self.num_authors)
+        train, test = [], []
+        for author in authors:
+            for story in self.stories[author]:
+                (test if name_has_substring(story, self.attack) else train).append((author, story))
+        return train, test
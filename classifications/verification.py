@@ -0,0 +1,217 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    Author verification: did author X write this text?
+    Every author gets a model of their natural texts, on features normalized over all natural texts:
+        - 'profile': the centroid of the author's texts; the score of a text is minus its L1 distance to the centroid,
+            relative to the mean distance of the author's own texts
+        - 'ocsvm': a one-class SVM, the score is its decision function
+    Higher scores mean more likely written by the author.
+    The models are fitted once and kept in a model cache file, refitted only when the data, method or features change.
+    The *_verification texts are evaluated against every author at once: one score matrix of texts x authors.
+"""
+
+import os, cPickle, hashlib
+from time import time
+
+import numpy as np
+
+from helper_classes import Zscore_Normalizer
+from att_classify import name_has_substring
+from metrics import roc_auc, equal_error_rate
+from feature_extraction.profiling import stage
+
+NOT_NATURAL = ['verification', 'imitation', 'obfuscation']
+
+
+def data_signature(data, method, features):
+    """
+        Changes when the texts, their feature values (recomputed by feature_store.update_features, say),
+            the method or the selected features change
+    """
+    digest = hashlib.sha1(repr((method, features)))
+    for a in sorted(data.keys()):
+        for s in sorted(data[a].keys()):
+            digest.update(repr((a, s, tuple(data[a][s]))))
+    return digest.hexdigest()
+
+
+class Verification_Models:
+    """
+        One model per author, see the module description. _data_ is {author: {story: feature vector}},
+            as att_classify.data_select_specific_features makes it.
+    """
+    def __init__(self, data, method='profile', features=False):
+        assert method in ['profile', 'ocsvm'], "Unknown verification method: " + method
+        self.method = method
+        self.features = features
+        self.signature = data_signature(data, method, features)
+        self.authors = sorted(data.keys())
+
+        rows = []
+        codes = []
+        for i, author in enumerate(self.authors):
+            for story in sorted(data[author].keys()):
+                if not name_has_substring(story, NOT_NATURAL):
+                    rows.append(data[author][story])
+                    codes.append(i)
+
+        self.normalizer = Zscore_Normalizer(rows)
+        rows = self.normalize(rows)
+        codes = np.asarray(codes)
+
+        with stage("verification.fit"):
+            if method == 'profile':
+                counts = np.bincount(codes, minlength=len(self.authors))
+                sums = np.zeros((len(self.authors), rows.shape[1]))
+                np.add.at(sums, codes, rows)
+                self.centroids = sums / counts[:, None]
+                own = np.abs(rows - self.centroids[codes]).sum(1)
+                self.scales = np.bincount(codes, own, minlength=len(self.authors)) / counts
+                self.scales[self.scales == 0] = 1.0
+            else:
+                from sklearn.svm import OneClassSVM
+                self.models = []
+                for i in xrange(len(self.authors)):
+                    model = OneClassSVM(kernel='rbf', nu=0.1, gamma=0.7 / rows.shape[1])
+                    model.fit(rows[codes == i])
+                    self.models.append(model)
+
+    def normalize(self, rows):
+        return self.normalizer.normalize(rows)
+
+    def score_matrix(self, rows, block_size=2 ** 22):
+        """
+            Scores of every text in _rows_ (raw feature vectors) for every author, texts x authors
+        """
+        rows = self.normalize(rows)
+        with stage("verification.score"):
+            if self.method == 'profile':
+                scores = np.empty((len(rows), len(self.authors)))
+                step = max(1, block_size // max(1, self.centroids.size))
+                for i in xrange(0, len(rows), step):
+                    distances = np.abs(rows[i:i + step, None, :] - self.centroids[None, :, :]).sum(2)
+                    scores[i:i + step] = -distances / self.scales[None, :]
+                return scores
+            return np.array([ m.decision_function(rows).ravel() for m in self.models ]).T
+
+    def scores(self, authors, rows):
+        """
+            The score of each (author, text) pair
+        """
+        index = dict([ (a, i) for i, a in enumerate(self.authors) ])
+        codes = np.array([ index[a] for a in authors ])
+        if self.method == 'profile':
+            normalized = self.normalize(rows)
+            with stage("verification.score"):
+                return -np.abs(normalized - self.centroids[codes]).sum(1) / self.scales[codes]
+        scores = np.empty(len(codes))
+        normalized = self.normalize(rows)
+        with stage("verification.score"):
+            for code in np.unique(codes):
+                selected = codes == code
+                scores[selected] = self.models[code].decision_function(normalized[selected]).ravel()
+        return scores
+
+    def verify(self, author, row, threshold):
+        """
+            True when the text _row_ is accepted as written by _author_
+        """
+        return self.scores([author], [row])[0] >= threshold
+
+    def save(self, filename):
+        f = open(filename + ".tmp", 'wb')
+        cPickle.dump(self, f, cPickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(filename + ".tmp", filename)
+
+
+def load_models(data, filename, method='profile', features=False):
+    """
+        The models from the cache _filename_, fitted and stored first when they are missing or out of date
+    """
+    if os.path.exists(filename):
+        f = open(filename, 'rb')
+        models = cPickle.load(f)
+        f.close()
+        if models.signature == data_signature(data, method, features):
+            return models
+    models = Verification_Models(data, method, features)
+    models.save(filename)
+    return models
+
+
+def evaluate_verification(data, models, single=200):
+    """
+        Scores every verification text against every author; the pair of a text and its own author is genuine,
+            all other pairs are impostors.
+        Reports the AUC, the equal error rate with its threshold, and the latency: per pair in bulk,
+            and per single verify call (on _single_ pairs).
+    """
+    rows = []
+    authors = []
+    for author in sorted(data.keys()):
+        for story in sorted(data[author].keys()):
+            if name_has_substring(story, ['verification']):
+                rows.append(data[author][story])
+                authors.append(author)
+    assert rows, "No verification texts"
+
+    start = time()
+    scores = models.score_matrix(rows)
+    bulk = time() - start
+    genuine = np.array([ [ a == b for b in models.authors ] for a in authors ])
+
+    auc = roc_auc(scores.ravel(), genuine.ravel())
+    eer, threshold = equal_error_rate(scores.ravel(), genuine.ravel())
+    accepted = scores >= threshold
+
+    pairs = [ (models.authors[j], i) for i in xrange(len(rows)) for j in xrange(len(models.authors)) ][:single]
+    start = time()
+    for author, i in pairs:
+        models.verify(author, rows[i], threshold)
+    single_seconds = (time() - start) / max(1, len(pairs))
+
+    report = {
+        'texts': len(rows),
+        'pairs': scores.size,
+        'auc': auc,
+        'equal_error_rate': eer,
+        'threshold': threshold,
+        'true_acceptance_rate': accepted[genuine].mean(),
+        'false_acceptance_rate': accepted[~genuine].mean(),
+        'bulk_seconds': bulk,
+        'bulk_ms_per_pair': 1000.0 * bulk / scores.size,
+        'single_ms_per_verification': 1000.0 * single_seconds,
+    }
+    for key, value in sorted(report.items()):
+        print "%-28s %s" % (key, value)
+    return report
+
+
+if __name__ == '__main__':
+    from att_classify import data_select_specific_features
+    from feature_extraction.feature_store import load_features
+    # Through the module, so the cached models refer to verification.Verification_Models and not to __main__
+    from verification import load_models, evaluate_verification
+    print "Loading data.."
+    data = data_select_specific_features(load_features())
+    print "Working..."
+
+    for method in ['profile', 'ocsvm']:
+        print method
+        models = load_models(data, "verification_" + method + ".pickle", method)
+        evaluate_verification(data, models)
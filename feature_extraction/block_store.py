@@ -0,0 +1,183 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    Block compressed container for documents and feature rows.
+    Records (a key and a marshalled value) are packed into blocks of about _block_size_ bytes,
+        each block is compressed on its own (zlib or bz2). An index at the end of the file gives,
+        for every key, its block and its place in the block.
+    So one record is read by decompressing only its block, and reading everything is one pass over the blocks.
+    Layout: MAGIC, the blocks, the compressed index, and a footer with the offset and length of the index.
+"""
+
+import os, struct, marshal, zlib, bz2
+from collections import OrderedDict
+
+MAGIC = "BLKZ1\n"
+FOOTER = "<QQ"
+CODECS = {
+    'zlib': (lambda data, level : zlib.compress(data, level), zlib.decompress),
+    'bz2': (lambda data, level : bz2.compress(data, level), bz2.decompress),
+}
+
+
+def is_block_file(filename):
+    if not os.path.isfile(filename):
+        return False
+    f = open(filename, 'rb')
+    start = f.read(len(MAGIC))
+    f.close()
+    return start == MAGIC
+
+
+class Block_Writer:
+    """
+        Writes a container; records are added with put, the file is complete after close.
+        It is written under a temporary name and renamed on close, so a reader never sees half a container.
+    """
+    def __init__(self, filename, codec='zlib', level=6, block_size=2 ** 16):
+        self.filename = filename
+        self.codec = codec
+        self.compress = CODECS[codec][0]
+        self.level = level
+        self.block_size = block_size
+        self.f = open(filename + ".tmp", 'wb')
+        self.f.write(MAGIC)
+        self.blocks = []
+        self.keys = []
+        self.records = []
+        self.buffer = []
+        self.buffered = 0
+
+    def put(self, key, value):
+        data = marshal.dumps(value)
+        self.keys.append(key)
+        self.records.append((len(self.blocks), self.buffered, len(data)))
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        block = self.compress("".join(self.buffer), self.level)
+        self.blocks.append((self.f.tell(), len(block)))
+        self.f.write(block)
+        self.buffer = []
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        index = zlib.compress(marshal.dumps({'codec': self.codec, 'blocks': self.blocks, 'keys': self.keys, 'records': self.records}))
+        offset = self.f.tell()
+        self.f.write(index)
+        self.f.write(struct.pack(FOOTER, offset, len(index)))
+        self.f.close()
+        os.rename(self.filename + ".tmp", self.filename)
+
+
+class Block_Reader:
+    """
+        Random access to the records of a container. The last _cached_ decompressed blocks are kept.
+    """
+    def __init__(self, filename, cached=8):
+        self.f = open(filename, 'rb')
+        assert self.f.read(len(MAGIC)) == MAGIC, "Not a block container: " + filename
+        self.f.seek(-struct.calcsize(FOOTER), os.SEEK_END)
+        offset, length = struct.unpack(FOOTER, self.f.read(struct.calcsize(FOOTER)))
+        self.f.seek(offset)
+        index = marshal.loads(zlib.decompress(self.f.read(length)))
+        self.decompress = CODECS[index['codec']][1]
+        self.blocks = index['blocks']
+        self.keys = index['keys']
+        self.records = index['records']
+        self.positions = dict([ (k, i) for i, k in enumerate(self.keys) ])
+        self.cache = OrderedDict()
+        self.cached = cached
+
+    def block(self, number):
+        data = self.cache.pop(number, None)
+        if data is None:
+            offset, length = self.blocks[number]
+            self.f.seek(offset)
+            data = self.decompress(self.f.read(length))
+        self.cache[number] = data
+        if len(self.cache) > self.cached:
+            self.cache.popitem(last=False)
+        return data
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def __getitem__(self, key):
+        number, start, length = self.records[self.positions[key]]
+        return marshal.loads(self.block(number)[start:start + length])
+
+    def items(self):
+        """
+            Yields all (key, value) pairs in the order they were written, decompressing every block once
+        """
+        number = None
+        data = None
+        for key, (block, start, length) in zip(self.keys, self.records):
+            if block != number:
+                number = block
+                offset, size = self.blocks[block]
+                self.f.seek(offset)
+                data = self.decompress(self.f.read(size))
+            yield key, marshal.loads(data[start:start + length])
+
+    def close(self):
+        self.f.close()
+
+
+def write_nested(filename, data, **kwargs):
+    """
+        Writes {author: {story: value}} with a record per (author, story), in sorted order
+    """
+    writer = Block_Writer(filename, **kwargs)
+    for author in sorted(data.keys()):
+        for story in sorted(data[author].keys()):
+            writer.put((author, story), data[author][story])
+    writer.close()
+
+
+def read_nested(filename):
+    """
+        Reads what write_nested wrote back into {author: {story: value}}
+    """
+    reader = Block_Reader(filename)
+    data = dict()
+    for (author, story), value in reader.items():
+        data.setdefault(author, dict())[story] = value
+    reader.close()
+    return data
+
+
+def convert_shelve(filename, output, **kwargs):
+    """
+        Copies a shelve (a blog_*.shelve or cached_blogs.shelve) to a container with the same keys
+    """
+    import shelve
+    source = shelve.open(filename, 'r')
+    writer = Block_Writer(output, **kwargs)
+    for key in sorted(source.keys()):
+        writer.put(key, source[key])
+    writer.close()
+    source.close()
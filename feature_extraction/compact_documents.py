@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    Compact representation of preprocessed documents.
+    process_raw_text gives (words, sentences, tags, chunks) as nested tuples of unicode strings,
+        so every word is stored twice and every tag is a separate string object.
+    A Compact_Document stores:
+        - the words as int32 ids into a shared Vocabulary
+        - where each sentence starts (sentence i is words[offsets[i]:offsets[i+1]])
+        - the tags as uint8 codes into SIMPLE_TAGS
+        - the chunks as uint8 codes into the chunk labels of the Vocabulary, with their own sentence offsets
+"""
+
+import sys, struct
+from array import array
+
+from constants import SIMPLE_TAGS, CHUNKS
+
+TAG_CODES = dict([ (t, i) for i, t in enumerate(SIMPLE_TAGS) ])
+
+
+class Vocabulary:
+    """
+        Interns words (and chunk labels) to integer ids.
+    """
+    def __init__(self, words=(), labels=CHUNKS):
+        self.words = []
+        self.word_ids = dict()
+        self.labels = []
+        self.label_ids = dict()
+        for w in words:
+            self.word_id(w)
+        for l in labels:
+            self.label_id(l)
+
+    def word_id(self, word):
+        i = self.word_ids.get(word)
+        if i is None:
+            i = self.word_ids[word] = len(self.words)
+            self.words.append(word)
+        return i
+
+    def label_id(self, label):
+        i = self.label_ids.get(label)
+        if i is None:
+            assert len(self.labels) < 256, "Too many chunk labels for uint8 codes"
+            i = self.label_ids[label] = len(self.labels)
+            self.labels.append(label)
+        return i
+
+    def __len__(self):
+        return len(self.words)
+
+    def to_string(self):
+        # Words never contain breaks, see process_raw_text
+        words = u"\n".join(self.words).encode("utf8")
+        labels = u"\n".join(self.labels).encode("utf8")
+        return struct.pack("<II", len(words), len(labels)) + words + labels
+
+    @staticmethod
+    def from_string(data):
+        w, l = struct.unpack("<II", data[:8])
+        words = data[8:8 + w].decode("utf8")
+        labels = data[8 + w:8 + w + l].decode("utf8")
+        return Vocabulary(words.split(u"\n") if w else [], labels.split(u"\n") if l else [])
+
+
+class Compact_Document(object):
+    """
+        One preprocessed document, see the module description.
+    """
+    __slots__ = ('token_ids', 'sentence_offsets', 'tag_codes', 'chunk_codes', 'chunk_offsets')
+
+    def __init__(self, token_ids, sentence_offsets, tag_codes, chunk_codes, chunk_offsets):
+        self.token_ids = token_ids
+        self.sentence_offsets = sentence_offsets
+        self.tag_codes = tag_codes
+        self.chunk_codes = chunk_codes
+        self.chunk_offsets = chunk_offsets
+
+    @staticmethod
+    def from_processed(words, sentences, tags, chunks, vocabulary):
+        """
+            Makes a compact document from the output of process_raw_text.
+        """
+        token_ids = array('i')
+        sentence_offsets = array('I', [0])
+        for s in sentences:
+            token_ids.extend([ vocabulary.word_id(w) for w in s ])
+            sentence_offsets.append(len(token_ids))
+        tag_codes = array('B', [ TAG_CODES[t] for ts in tags for t in ts ])
+        chunk_codes = array('B')
+        chunk_offsets = array('I', [0])
+        for cs in chunks:
+            chunk_codes.extend([ vocabulary.label_id(c) for c in cs ])
+            chunk_offsets.append(len(chunk_codes))
+        return Compact_Document(token_ids, sentence_offsets, tag_codes, chunk_codes, chunk_offsets)
+
+    def unpack(self, vocabulary):
+        """
+            Returns (words, sentences, tags, chunks) as process_raw_text made them,
+                so the result can go straight into get_features.
+            Equal words are the same string object.
+        """
+        words = vocabulary.words
+        labels = vocabulary.labels
+        offsets = self.sentence_offsets
+        sentences = tuple([ tuple([ words[i] for i in self.token_ids[offsets[j]:offsets[j+1]] ]) for j in xrange(len(offsets) - 1) ])
+        tags = tuple([ tuple([ SIMPLE_TAGS[c] for c in self.tag_codes[offsets[j]:offsets[j+1]] ]) for j in xrange(len(offsets) - 1) ])
+        offsets = self.chunk_offsets
+        chunks = tuple([ tuple([ labels[c] for c in self.chunk_codes[offsets[j]:offsets[j+1]] ]) for j in xrange(len(offsets) - 1) ])
+        flat = tuple([ w for s in sentences for w in s ])
+        return flat, sentences, tags, chunks
+
+    def to_string(self):
+        """
+            Serialises the document: a header with the array lengths, then the raw arrays (little endian).
+        """
+        arrays = [ self.token_ids, self.sentence_offsets, self.tag_codes, self.chunk_codes, self.chunk_offsets ]
+        if sys.byteorder != 'little':
+            arrays = [ array(a.typecode, a) for a in arrays ]
+            [ a.byteswap() for a in arrays ]
+        return struct.pack("<5I", *[ len(a) for a in arrays ]) + "".join([ a.tostring() for a in arrays ])
+
+    @staticmethod
+    def from_string(data):
+        lengths = struct.unpack("<5I", data[:20])
+        position = 20
+        arrays = []
+        for typecode, length in zip("iIBBI", lengths):
+            a = array(typecode)
+            size = length * a.itemsize
+            a.fromstring(data[position:position + size])
+            position += size
+            if sys.byteorder != 'little':
+                a.byteswap()
+            arrays.append(a)
+        return Compact_Document(*arrays)
+
+
+def get_features_compact(document, vocabulary):
+    """
+        get_features for a Compact_Document
+    """
+    from feature_extraction import get_features
+    return get_features(*document.unpack(vocabulary))
+
+
+def compact_dataset(data, vocabulary=None):
+    """
+        Converts a data set as made by create_Datasets.create_cached_dataset ({author: {story: (w, s, t, c)}})
+            to compact documents sharing one vocabulary.
+    """
+    if vocabulary is None:
+        vocabulary = Vocabulary()
+    compact = dict()
+    for author in sorted(data.keys()):
+        compact[author] = dict()
+        for story in sorted(data[author].keys()):
+            compact[author][story] = Compact_Document.from_processed(*data[author][story], vocabulary=vocabulary)
+    return vocabulary, compact
+
+
+MAGIC = "CDOC1\n"
+
+
+def save_dataset(filename, vocabulary, compact):
+    """
+        Writes a compact data set: the vocabulary, then (author, story, document) records,
+            each part preceded by its length.
+    """
+    def write(f, data):
+        f.write(struct.pack("<I", len(data)))
+        f.write(data)
+
+    f = open(filename, 'wb')
+    f.write(MAGIC)
+    write(f, vocabulary.to_string())
+    for author in sorted(compact.keys()):
+        for story in sorted(compact[author].keys()):
+            write(f, author.encode("utf8"))
+            write(f, story.encode("utf8"))
+            write(f, compact[author][story].to_string())
+    f.close()
+
+
+def load_dataset(filename):
+    """
+        Reads what save_dataset wrote, returns (vocabulary, {author: {story: Compact_Document}})
+    """
+    f = open(filename, 'rb')
+    assert f.read(len(MAGIC)) == MAGIC, "Not a compact data set: " + filename
+
+    def read():
+        header = f.read(4)
+        if not header:
+            return None
+        return f.read(struct.unpack("<I", header)[0])
+
+    vocabulary = Vocabulary.from_string(read())
+    compact = dict()
+    while True:
+        author = read()
+        if author is None:
+            break
+        story = read().decode("utf8")
+        compact.setdefault(author.decode("utf8"), dict())[story] = Compact_Document.from_string(read())
+    f.close()
+    return vocabulary, compact
@@ -0,0 +1,114 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    Ingestion of a corpus in the <corpus>/<author>/<story>.txt layout (Drexel-AMT, Brennan-Greenstadt).
+    The corpus is listed once into a manifest: one entry (author, story, type, path, size, mtime) per file.
+    prefetch reads the files of a manifest in a pool of threads, a bounded number of files ahead of the consumer,
+        so reading (slow on network filesystems) overlaps with the tagging of the texts already read.
+    Reads that fail are retried with a growing delay, for filesystems that drop requests now and then.
+"""
+
+import os, json, time
+from collections import deque
+
+STORY_TYPES = ['demographics', 'verification', 'imitation', 'obfuscation']
+
+
+def story_type(story):
+    for t in STORY_TYPES:
+        if t in story:
+            return t
+    return 'natural'
+
+
+def build_manifest(datafolder):
+    """
+        Lists every file of the corpus in _datafolder_, sorted by author and story
+    """
+    entries = []
+    for author in sorted(os.listdir(datafolder)):
+        folder = os.path.join(datafolder, author)
+        if author.startswith(".") or not os.path.isdir(folder):
+            continue
+        for story in sorted(os.listdir(folder)):
+            if story.startswith("."):
+                continue
+            path = os.path.join(folder, story)
+            info = os.stat(path)
+            entries.append({'author': author, 'story': story, 'type': story_type(story),
+                            'path': path, 'size': info.st_size, 'mtime': info.st_mtime})
+    return entries
+
+
+def write_manifest(entries, filename):
+    f = open(filename + ".tmp", 'w')
+    for entry in entries:
+        f.write(json.dumps(entry, sort_keys=True) + "\n")
+    f.close()
+    os.rename(filename + ".tmp", filename)
+
+
+def read_manifest(filename):
+    f = open(filename)
+    entries = [ json.loads(line) for line in f if line.strip() ]
+    f.close()
+    return entries
+
+
+def read_text(filename, retries=3, delay=0.5):
+    """
+        The text of a file as load_file reads it (lines joined with spaces, utf8 decoded).
+        IO errors are retried _retries_ times, waiting _delay_ seconds and doubling it every time.
+    """
+    for attempt in xrange(retries + 1):
+        try:
+            f = open(filename, 'r')
+            try:
+                lines = f.readlines()
+            finally:
+                f.close()
+            return "".join([ x + " " for x in lines ]).decode("utf8")
+        except (IOError, OSError):
+            if attempt == retries:
+                raise
+            time.sleep(delay * 2 ** attempt)
+
+
+def prefetch(entries, reader=read_text, threads=8, lookahead=32):
+    """
+        Yields (entry, text) for the _entries_ of a manifest, in their order.
+        At most _lookahead_ files are read ahead, by _threads_ threads.
+    """
+    if threads <= 1:
+        for entry in entries:
+            yield entry, reader(entry['path'])
+        return
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(threads)
+    pending = deque()
+    try:
+        for entry in entries:
+            pending.append((entry, pool.apply_async(reader, (entry['path'],))))
+            if len(pending) >= lookahead:
+                entry, result = pending.popleft()
+                yield entry, result.get()
+        while pending:
+            entry, result = pending.popleft()
+            yield entry, result.get()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -19,32 +19,126 @@ import shelve, os
 from itertools import chain
 flatten = lambda x : list(chain(*x))
 
-from pattern.en import parsetree
-from nltk.tokenize import sent_tokenize, word_tokenize
-from nltk.tag import pos_tag, map_tag
-simplify_tag = lambda t : map_tag('en-ptb', 'universal', t)
+from constants import SIMPLE_TAGS
+from profiling import stage
+from sentence_cache import Sentence_Cache
+
+# The nlp libraries take long to import and to load their models,
+# so they are only loaded (once) when the first text is processed. See load_taggers.
+parsetree = pattern_tokenize = sent_tokenize = word_tokenize = pos_tag = None
+
+# Penn treebank tag -> index of its universal tag in SIMPLE_TAGS, see load_tag_table
+PTB_TAG_CODES = None
+X_CODE = SIMPLE_TAGS.index('X')
+
+# Tags and chunks of recently seen sentences, see set_sentence_cache
+SENTENCE_CACHE = Sentence_Cache()
+
+
+def load_taggers(warm_up=False):
+    """
+        Imports pattern and NLTK on first use.
+        With _warm_up_ the tagger models are loaded right away too,
+            so a long running process pays for that before the first text instead of during it.
+    """
+    global parsetree, pattern_tokenize, sent_tokenize, word_tokenize, pos_tag
+    if parsetree is None:
+        with stage("load_taggers"):
+            from pattern.en import parsetree
+            from pattern.en import tokenize as pattern_tokenize
+            from nltk.tokenize import sent_tokenize, word_tokenize
+            from nltk.tag import pos_tag
+            load_tag_table()
+    if warm_up:
+        process_raw_text(u"Loading the taggers. This is done once.")
+
+
+def load_tag_table():
+    """
+        Compiles NLTK's en-ptb -> universal mapping once into a plain dictionary of SIMPLE_TAGS codes,
+            instead of going through map_tag for every token.
+        Unknown tags become 'X', as with map_tag.
+    """
+    global PTB_TAG_CODES
+    from nltk.tag.mapping import tagset_mapping
+    mapping = tagset_mapping('en-ptb', 'universal')
+    PTB_TAG_CODES = dict([ (ptb, SIMPLE_TAGS.index(universal)) for ptb, universal in mapping.items() ])
+    return PTB_TAG_CODES
+
+
+def tag_codes(tags):
+    """
+        Universal tag codes (indexes in SIMPLE_TAGS) for a sequence of Penn treebank tags
+    """
+    if PTB_TAG_CODES is None:
+        load_tag_table()
+    get = PTB_TAG_CODES.get
+    return [ get(t, X_CODE) for t in tags ]
+
+
+def simplify_tag(t):
+    return SIMPLE_TAGS[tag_codes([t])[0]]
+
+
+def set_sentence_cache(cache):
+    """
+        Use _cache_ (a Sentence_Cache) for the tags and chunks of sentences, None switches caching off.
+    """
+    global SENTENCE_CACHE
+    SENTENCE_CACHE = cache
+
+
+def cached(kind, sentence, compute):
+    if SENTENCE_CACHE is None:
+        return compute(sentence)
+    return SENTENCE_CACHE.get(kind, sentence, compute)
+
+
+def chunk_sentence(sentence):
+    """
+        The chunk types of one sentence, as split by pattern's tokenizer.
+        pattern parses the sentences of a text one by one, so this gives the same chunks as parsing the whole text.
+    """
+    with stage("parsetree"):
+        return tuple([ c.type for t in parsetree(sentence, tokenize=False) for c in t.chunks ])
+
+
+def tag_sentence(sentence):
+    """
+        The (word, universal tag) pairs of one sentence, as split by NLTK's sentence tokenizer.
+    """
+    with stage("pos_tag"):
+        tagged = pos_tag(word_tokenize(sentence))
+        codes = tag_codes([ t for _, t in tagged ])
+        return tuple([ (tagged[i][0], SIMPLE_TAGS[codes[i]]) for i in xrange(len(tagged)) ])
 
 
 def process_raw_text(text):
     """
         First some code to standardize the formatting, then basic nlp.
     """
-    # Remove breaks and tabs
-    for char in ["\t", "\n"]:
-        text = text.replace(char, " ")
-    text = text.replace('."', '".')
-    text = text.replace(".'", "'.")
-    # Split special characters from words
-    for char in ["'", '"', ",", ".", "?", "!", ";", ":"]:
-        text = text.replace(char, " " + char + " ")
-    # Magic to remove all multi-spaces
-    text = ' '.join(text.split())
+    if parsetree is None:
+        load_taggers()
+
+    with stage("normalise"):
+        # Remove breaks and tabs
+        for char in ["\t", "\n"]:
+            text = text.replace(char, " ")
+        text = text.replace('."', '".')
+        text = text.replace(".'", "'.")
+        # Split special characters from words
+        for char in ["'", '"', ",", ".", "?", "!", ";", ":"]:
+            text = text.replace(char, " " + char + " ")
+        # Magic to remove all multi-spaces
+        text = ' '.join(text.split())
 
     # get the words, sentences, POS tags, and chunks.
-    chunks = [ tuple([ c.type for c in t.chunks ]) for t in parsetree(text) ]
-    sentences = sent_tokenize(text)
-    sentences = [ word_tokenize(s) for s in sentences ]
-    sentences_tags = [ tuple([ (w, simplify_tag(t)) for w, t in pos_tag(s) ]) for s in sentences ]
+    # Sentence by sentence, so that repeated sentences come from the cache.
+    with stage("tokenize"):
+        chunk_sentences = pattern_tokenize(text)
+        sentences = sent_tokenize(text)
+    chunks = [ cached("chunks", s, chunk_sentence) for s in chunk_sentences ]
+    sentences_tags = [ cached("tags", s, tag_sentence) for s in sentences ]
 
     sentences = [ tuple([ w for w, _ in s]) for s in sentences_tags ]
     tags = [ tuple([ t for _, t in s]) for s in sentences_tags ]
@@ -61,17 +155,85 @@ def load_file(filename='text.txt'):
         - POS-tags (ordered list of tags, per sentence)
         - chunks
     """
-    f = open(filename,'r')
-    text = "".join([ x + " " for x in f.readlines() ]).decode("utf8")
-    f.close()
+    from corpus_manifest import read_text
+    with stage("load_file"):
+        text = read_text(filename)
     return process_raw_text(text)
 
 
-def process_blog(filename):
+def load_file_chunked(filename='text.txt', chunk_size=100000):
+    """
+        Like load_file, but for texts too long to process at once.
+        Yields the processed text in pieces of about _chunk_size_ characters.
+        Pieces are only cut at empty lines (paragraph breaks). A paragraph without final punctuation
+            can still end up in another sentence than when the whole text is tokenized at once,
+            so sentence boundaries at the cuts may differ from load_file.
+    """
+    f = open(filename, 'r')
+    lines = []
+    size = 0
+    for line in f:
+        lines.append(line + " ")
+        size += len(line)
+        if size >= chunk_size and not line.strip():
+            yield process_raw_text("".join(lines).decode("utf8"))
+            lines = []
+            size = 0
+    f.close()
+    if "".join(lines).strip():
+        yield process_raw_text("".join(lines).decode("utf8"))
+
+
+def iter_blog_posts(filename, min_length=0):
+    """
+        Streams the posts of a bloggers archive, one post at a time.
+        Gives the same posts as splitting the whole archive on <post> and </post>,
+            but never holds more than one post in memory.
+        Posts of _min_length_ characters or less are skipped.
+    """
+    open_tag, close_tag = "<post>", "</post>"
+    f = open(filename, 'r')
+    post = None     # None while we are outside of a post
+    for line in f:
+        line = line + " "
+        while True:
+            start = line.find(open_tag)
+            if post is None:
+                if start == -1:
+                    break
+                post = []
+                line = line[start + len(open_tag):]
+                continue
+
+            stop = line.find(close_tag)
+            if stop != -1 and (start == -1 or stop < start):
+                end, rest, next_post = stop, line[stop + len(close_tag):], None
+            elif start != -1:
+                end, rest, next_post = start, line[start + len(open_tag):], []
+            else:
+                post.append(line)
+                break
+
+            post.append(line[:end])
+            text = "".join(post).decode("utf8", 'ignore')
+            if len(text) > min_length:
+                yield text
+            post, line = next_post, rest
+
+    f.close()
+    if post is not None:
+        text = "".join(post).decode("utf8", 'ignore')
+        if len(text) > min_length:
+            yield text
+
+
+def process_blog(filename, min_posts=15, min_words=510):
     """
         This reads in a bloggers argive, and splits up the posts
         It is filled with early returns that return None
             in case certain criteria are not met.
+        The cheap criteria (name, number of long enough posts) are checked before any nlp is done,
+            and the nlp stops as soon as the blogger can no longer reach _min_posts_.
     """
     def name_to_info(name):
         info = name.split('/').pop().split('.')
@@ -82,68 +244,113 @@ def process_blog(filename):
     if 'indUnk' in filename:
         return (None, None), None
 
-    f = open(filename, 'r')
-    content = "".join([ x + " " for x in f.readlines() ])
-    f.close()
+    # A post needs on average at least 3 characters per word to have enough words.
+    min_length = min_words * 3
 
-    content = content.split("<post>")
-    content.pop(0)
-    if not len(content) > 14:
+    # First pass: only count the candidate posts, without keeping them.
+    candidates = sum(1 for _ in iter_blog_posts(filename, min_length))
+    if candidates < min_posts:
         return (None, None), None
 
-    stories = [ x.split('</post>')[0].decode("utf8", 'ignore') for x in content ]
-    stories = filter(lambda x : len(x) > (510 * 3), stories)
+    # Second pass: nlp on one post at a time, stop when the blogger can't qualify anymore.
+    stories = []
+    for story in iter_blog_posts(filename, min_length):
+        candidates -= 1
+        story = process_raw_text(story)
+        if len(story[0]) > min_words:
+            stories.append(story)
+        if len(stories) + candidates < min_posts:
+            return (None, None), None
 
-    if not len(content) > 14:
-        return (None, None), None
-
-    stories = map(process_raw_text, stories)
-    stories = filter(lambda x : len(x[0]) > 510, stories)
-    if not len(stories) > 14:
-        return (None, None), None
-    else:
-        return name_to_info(filename), stories
+    return name_to_info(filename), stories
 
 
-def create_cached_dataset_blogs(datafolder, cachelocation="../rawb/"):
+def create_cached_dataset_blogs(datafolder, cachelocation="../rawb/", manifest="../rawb_manifest.log", retry_failed=False):
     """
         Create the blog data set.
+        Progress is kept in _manifest_ (relative to _datafolder_), so when the job is interrupted
+            it continues where it was on the next run.
     """
+    from job_manifest import Job_Manifest, Progress, DONE, SKIPPED, FAILED
+
     blogs = sorted(filter(lambda x : not x.startswith("."), os.listdir(datafolder)))
     cache = os.path.join(datafolder, cachelocation)
-    for i in xrange(len(blogs)):
-        b = blogs[i]
-        if i % 100 == 0:
-            print "\tWorking on:", i, '\t', (datafolder + b).split("/").pop()
-        (blog_id, info), posts = process_blog(datafolder + b)
+    jobs = Job_Manifest(os.path.join(datafolder, manifest), blogs)
+    todo = jobs.todo(retry_failed)
+    print "\t", len(blogs) - len(todo), "of", len(blogs), "blogs already handled", jobs.counts()
+
+    progress = Progress(len(todo))
+    for b in todo:
+        try:
+            (blog_id, info), posts = process_blog(datafolder + b)
+        except Exception as e:
+            jobs.mark(b, FAILED, repr(e))
+            progress.step(b)
+            continue
         if not blog_id == None:
+            # Writing the same blog again after a crash just overwrites it
             sh = shelve.open(cache + 'blog_' + blog_id + '.shelve')
             sh[blog_id] = (info, posts)
             sh.close()
-    print "Done!"
+            jobs.mark(b, DONE, len(posts))
+        else:
+            jobs.mark(b, SKIPPED)
+        progress.step(b)
+    jobs.close()
+    print "Done!", jobs.counts()
+    if SENTENCE_CACHE is not None:
+        print "Sentence cache:", SENTENCE_CACHE.stats()
 
 
-def create_cached_dataset(datafolder):
+def create_cached_dataset(datafolder, compact=False, threads=8, manifest=None, compress=False):
     """
         Creates data set for the Drexel AMT corpus.
+        With _compact_ the data set is stored as compact documents (Dataset.cdoc, see compact_documents)
+            instead of as a python literal.
+        With _compress_ it is stored in a block container (Dataset.blkz, see block_store).
+        The corpus is listed once into a manifest (written to _manifest_ when given),
+            and the files are read by _threads_ threads ahead of the tagging, see corpus_manifest.
     """
-    folders = filter(lambda x : not x.startswith("."), os.listdir(datafolder))
+    from corpus_manifest import build_manifest, write_manifest, prefetch
+
+    entries = [ e for e in build_manifest(datafolder) if e['type'] != 'demographics' ]
+    if manifest is not None:
+        write_manifest(entries, manifest)
 
     dataset = dict()
-    for folder in folders:
-        print "Working on:", folder
-        dataset[folder] = dict()
-        files = filter(lambda x : not x.startswith("."), os.listdir(datafolder + folder))
-        for f in files:
-            if 'demographics' not in f:
-                w, s, t, c = load_file(datafolder + folder + "/" + f)
-                dataset[folder][f] = (w, s, t, c)
-    f = open(os.path.dirname(os.path.realpath(__file__)) + "Dataset.py", 'w')
+    for entry, text in prefetch(entries, threads=threads):
+        if entry['author'] not in dataset:
+            print "Working on:", entry['author']
+            dataset[entry['author']] = dict()
+        dataset[entry['author']][entry['story']] = process_raw_text(text)
+    if compress:
+        from block_store import write_nested
+        write_nested(os.path.join(os.path.dirname(os.path.realpath(__file__)), "Dataset.blkz"), dataset)
+        return
+    if compact:
+        from compact_documents import compact_dataset, save_dataset
+        vocabulary, documents = compact_dataset(dataset)
+        save_dataset(os.path.join(os.path.dirname(os.path.realpath(__file__)), "Dataset.cdoc"), vocabulary, documents)
+        return
+    f = open(os.path.join(os.path.dirname(os.path.realpath(__file__)), "Dataset.py"), 'w')
     f.write("# -*- coding: utf-8 -*-\n")
     f.write("data = " + str(dataset) + "\n")
     f.close()
 
 
+def load_dataset(filename):
+    """
+        Reads a data set written by create_cached_dataset, in any of its formats:
+            block container, compact documents or python literal.
+        Returns {author: {story: (words, sentences, tags, chunks)}}.
+    """
+    from feature_store import iter_documents
+    dataset = dict()
+    for author, story, document in iter_documents(filename):
+        dataset.setdefault(author, dict())[story] = document
+    return dataset
+
+
 def demo(datafolder):
     # Performs action just on one text file
     folder = filter(lambda x : not x.startswith("."), os.listdir(datafolder)).pop()
@@ -17,9 +17,9 @@
 
 from collections import defaultdict
 from itertools import chain
-flatten = lambda x : list(chain(*x))
 
 from constants import *
+from profiling import stage
 
 def rvd(numbers):
     """
@@ -98,7 +98,8 @@ def get_features(words, sentences, tags, chunks):
         special_char_set = set(SPECIAL_CHARS)
         normal_char_set = set(NORMAL_CHARS)
 
-        letters = flatten([w + " " for w in words])
+        # A generator, so a long text is never copied into a list of characters.
+        letters = chain.from_iterable(w + " " for w in words)
 
         special = 0
         normal = 0
@@ -108,7 +109,9 @@ def get_features(words, sentences, tags, chunks):
         tri_char_dist = dict([ (char, 0) for char in TRI_CHARS ])
         bigram = (None, None)
         trigram = (None, None, None)
+        letter_count = 0
         for l in letters:
+            letter_count += 1
             bigram = (bigram[1], l.lower())
             trigram = (trigram[1], trigram[2], l.lower())
 
@@ -127,7 +130,7 @@ def get_features(words, sentences, tags, chunks):
             if l.lower() in char_dist:
                 char_dist[l.lower()] += 1
 
-        lc = float(len(letters))
+        lc = float(letter_count)
         specials = [special / lc, normal / lc, upper / float(len(words))]
 
         lc = float(sum(char_dist.values()))
@@ -147,7 +150,7 @@ def get_features(words, sentences, tags, chunks):
             - POS-tags
             - common POS-tag bigrams
         """
-        tags = flatten([ ['<s>'] + list(ts) + ['</s>'] for ts in tags ])
+        tags = chain.from_iterable(chain(['<s>'], ts, ['</s>']) for ts in tags)
         tag_bi_dist = dict([ (t, 0) for t in BI_TAGS ])
         tag_dist = dict([ (t, 0) for t in SIMPLE_TAGS ])
         bigram = (None, None)
@@ -164,7 +167,7 @@ def get_features(words, sentences, tags, chunks):
         return mono, bi
 
     def get_chunk_distribution(chunks):
-        chunks = flatten([ ['<s>'] + list(cs) + ['</s>'] for cs in chunks ])
+        chunks = chain.from_iterable(chain(['<s>'], cs, ['</s>']) for cs in chunks)
         chunk_bi_dist = dict([ (c, 0) for c in BI_CHUNKS ])
         chunk_dist = dict([ (c, 0) for c in CHUNKS ])
         bigram = (None, None)
@@ -188,40 +191,351 @@ def get_features(words, sentences, tags, chunks):
         feature_dic[name] = tuple(vector)
 
     # Sentence length distribution
-    sentence_length_f = rvd([len(x) for x in sentences])
+    with stage("features.sentence_length"):
+        sentence_length_f = rvd([len(x) for x in sentences])
     append_features(sentence_length_f, "sentence_length")
 
     # Word length distribution
-    word_length_f = get_word_length_distribution(words)
+    with stage("features.word_length"):
+        word_length_f = get_word_length_distribution(words)
     append_features(word_length_f, "word_length")
 
     # char distribution
-    mono_char_dist, bi_char_dist, tri_char_dist = get_char_distribution(words)
+    with stage("features.char_dist"):
+        mono_char_dist, bi_char_dist, tri_char_dist = get_char_distribution(words)
     append_features(mono_char_dist, "mono_char_dist")
     append_features(bi_char_dist, "bi_char_dist")
     append_features(tri_char_dist, "tri_char_dist")
 
     # Tag distribution
-    mono, bi = get_tag_distribution(tags)
+    with stage("features.tag_dist"):
+        mono, bi = get_tag_distribution(tags)
     append_features(mono, "mono_tag_dist")
     append_features(bi, "bi_tag_dist")
 
     # Chunk distribution
-    mono, bi = get_chunk_distribution(chunks)
+    with stage("features.chunk_dist"):
+        mono, bi = get_chunk_distribution(chunks)
     append_features(mono, "mono_chunk_dist")
     append_features(bi, "bi_chunk_dist")
 
     # Readability
-    readability_f = get_readability(words, sentences)
+    with stage("features.readability"):
+        readability_f = get_readability(words, sentences)
     append_features(readability_f, "readability")
 
     # Legomena
-    legomena_f = get_legomena(words)
+    with stage("features.legomena"):
+        legomena_f = get_legomena(words)
     append_features(legomena_f, "legomena")
 
     return tuple(features), feature_dic
 
 
+def rvd_counts(counts, exact=True):
+    """
+        rvd for numbers given as a histogram: _counts_ maps every number on how often it occurs.
+        Returns the same as rvd on the list of all those numbers, without that list being made.
+        With _exact_ False sigma takes one step per distinct number instead of one per number,
+            which may differ from rvd in the last digits.
+    """
+    from math import sqrt
+    values = sorted([ v for v in counts if counts[v] > 0 ])
+    total = sum([ counts[v] for v in values ])
+
+    def nth(n):
+        # The n-th number of the sorted list
+        for v in values:
+            n -= counts[v]
+            if n < 0:
+                return v
+
+    mean = float(sum([ v * counts[v] for v in values ])) / total
+    deviation = 0
+    for v in values:
+        if exact:
+            # Same order of additions as rvd, so the very same float comes out
+            for _ in xrange(counts[v]):
+                deviation += (mean - v) ** 2
+        else:
+            deviation += counts[v] * (mean - v) ** 2
+    sigma = sqrt(deviation / total)
+
+    if total % 2 == 1:
+        median = nth(total/2)
+    else:
+        median = (nth((total-1)/2) + nth(total/2)) / 2.0
+
+    return [mean, median, median - mean, sigma]
+
+
+class Feature_Accumulator:
+    """
+        Accumulates the counts behind get_features over a document that comes in pieces.
+        Every piece is a (words, sentences, tags, chunks) quadruple, as made by process_raw_text.
+        The character and tag n-grams are carried over the boundaries of the pieces,
+            so get_features gives exactly the same as get_features on the whole document.
+        Memory depends on the vocabulary, not on the length of the document.
+    """
+    def __init__(self):
+        self.sentence_lengths = defaultdict(int)
+        self.word_lengths = defaultdict(int)
+        self.word_freqs = dict()
+        self.freq_freqs = defaultdict(int)
+        self.word_count = 0
+        self.char_count = 0
+        self.long_char_count = 0
+
+        self.letter_count = 0
+        self.special = 0
+        self.normal = 0
+        self.upper = 0
+        self.char_dist = dict([ (char, 0) for char in ALL_CHARS ])
+        self.bi_char_dist = dict([ (char, 0) for char in BI_CHARS ])
+        self.tri_char_dist = dict([ (char, 0) for char in TRI_CHARS ])
+
+        self.tag_dist = dict([ (t, 0) for t in SIMPLE_TAGS ])
+        self.tag_bi_dist = dict([ (t, 0) for t in BI_TAGS ])
+        self.chunk_dist = dict([ (c, 0) for c in CHUNKS ])
+        self.chunk_bi_dist = dict([ (c, 0) for c in BI_CHUNKS ])
+
+        # n-gram state at the end of what has been added so far
+        self.letter_state = (None, None)
+        self.tag_state = None
+        self.chunk_state = None
+
+    def add(self, words, sentences, tags, chunks):
+        """
+            Add the next piece of the document.
+        """
+        for s in sentences:
+            self.sentence_lengths[len(s)] += 1
+        self.add_words(words)
+        self.letter_state = self.add_letters(chain.from_iterable(w + " " for w in words), self.letter_state)
+        for ts in tags:
+            self.tag_state = self.add_sequence(ts, self.tag_dist, self.tag_bi_dist, self.tag_state)
+        for cs in chunks:
+            self.chunk_state = self.add_sequence(cs, self.chunk_dist, self.chunk_bi_dist, self.chunk_state)
+
+    def add_words(self, words, sign=1):
+        # Word length, readability and legomena counts. A _sign_ of -1 removes the words again.
+        for word in words:
+            l = len(word)
+            self.word_lengths[l] += sign
+            self.char_count += sign * l
+            if l > 6:
+                self.long_char_count += sign * l
+            freq = self.word_freqs.get(word, 0)
+            self.freq_freqs[freq] -= 1
+            self.freq_freqs[freq + sign] += 1
+            if freq + sign == 0:
+                del self.word_freqs[word]
+            else:
+                self.word_freqs[word] = freq + sign
+        self.word_count += sign * len(words)
+
+    def add_letters(self, letters, state=(None, None), sign=1, singles=True):
+        """
+            Count the characters and character n-grams of _letters_,
+                continuing from the last two (lowered) characters in _state_.
+            With _singles_ False only the n-grams are counted.
+            Returns the state after the last letter.
+        """
+        special_char_set = set(SPECIAL_CHARS)
+        normal_char_set = set(NORMAL_CHARS)
+        bi_char_dist = self.bi_char_dist
+        tri_char_dist = self.tri_char_dist
+        char_dist = self.char_dist
+
+        first, second = state
+        for l in letters:
+            lower = l.lower()
+            bigram = (second, lower)
+            trigram = (first, second, lower)
+            first, second = second, lower
+
+            if bigram in bi_char_dist:
+                bi_char_dist[bigram] += sign
+            if trigram in tri_char_dist:
+                tri_char_dist[trigram] += sign
+
+            if not singles:
+                continue
+            self.letter_count += sign
+            if l.isupper():
+                self.upper += sign
+            if lower in normal_char_set:
+                self.normal += sign
+            elif l in special_char_set:
+                self.special += sign
+            if lower in char_dist:
+                char_dist[lower] += sign
+        return first, second
+
+    def add_sequence(self, sequence, mono_dist, bi_dist, state=None, sign=1):
+        """
+            Count the tags (or chunks) of one sentence, with the sentence boundary markers.
+            Returns the last element, to continue the bigrams in the next sentence.
+        """
+        for t in chain(['<s>'], sequence, ['</s>']):
+            bigram = (state, t)
+            if bigram in bi_dist:
+                bi_dist[bigram] += sign
+            if t in mono_dist:
+                mono_dist[t] += sign
+            state = t
+        return state
+
+    def get_features(self, exact=True):
+        """
+            Returns the features of everything added so far, like get_features does.
+            See rvd_counts for _exact_.
+        """
+        features = []
+        feature_dic = dict()
+
+        def append_features(vector, name, features=features, feature_dic=feature_dic):
+            features += vector
+            feature_dic[name] = tuple(vector)
+
+        def relative(dist, keys):
+            total = float(sum(dist.values()))
+            return [ dist[key] / total for key in keys ]
+
+        append_features(rvd_counts(self.sentence_lengths, exact), "sentence_length")
+
+        max_len = 12
+        freqs = dict([ (i, 0) for i in xrange(1,max_len+1) ])
+        for l, count in self.word_lengths.items():
+            freqs[min(l, max_len)] += count
+        total = float(self.word_count)
+        word_length_f = [ freqs[i] / total for i in xrange(1,max_len+1) ] + rvd_counts(self.word_lengths, exact)
+        append_features(word_length_f, "word_length")
+
+        lc = float(self.letter_count)
+        specials = [self.special / lc, self.normal / lc, self.upper / float(self.word_count)]
+        append_features(specials + relative(self.char_dist, ALL_CHARS), "mono_char_dist")
+        append_features(relative(self.bi_char_dist, BI_CHARS), "bi_char_dist")
+        append_features(relative(self.tri_char_dist, TRI_CHARS), "tri_char_dist")
+
+        append_features(relative(self.tag_dist, SIMPLE_TAGS), "mono_tag_dist")
+        append_features(relative(self.tag_bi_dist, BI_TAGS), "bi_tag_dist")
+
+        append_features(relative(self.chunk_dist, CHUNKS), "mono_chunk_dist")
+        append_features(relative(self.chunk_bi_dist, BI_CHUNKS), "bi_chunk_dist")
+
+        char_count = float(self.char_count)
+        word_count = float(self.word_count)
+        sentence_count = float(sum(self.sentence_lengths.values()))
+        ARI = 4.71 * char_count / word_count  + 0.5 * word_count / sentence_count - 21.43
+        long_word_count = float(self.long_char_count)
+        LIX = word_count / sentence_count + 100 * long_word_count / word_count
+        append_features([ARI, LIX], "readability")
+
+        hapax = float(self.freq_freqs[1])
+        append_features([ self.freq_freqs[i] / hapax for i in xrange(2,7) ], "legomena")
+
+        return tuple(features), feature_dic
+
+
+def get_features_streaming(pieces):
+    """
+        get_features for a document that comes as an iterable of pieces (see create_Datasets.load_file_chunked).
+        Only one piece needs to be in memory at a time.
+    """
+    accumulator = Feature_Accumulator()
+    for piece in pieces:
+        accumulator.add(*piece)
+    return accumulator.get_features()
+
+
+def get_window_features(words, sentences, tags, chunks, size=500, stride=100):
+    """
+        Features of a sliding window over a document, for every _stride_ words.
+        A window holds the sentences that lie completely within its _size_ words.
+        The counts are updated for the sentences that enter and leave the window,
+            so the whole document takes about linear time instead of windows * size.
+        Returns the start (in words) of each window and its features, as get_features would give them
+            (rvd values may differ in the last digits).
+        Windows without a complete sentence are left out, and so are windows where a feature can't be computed
+            (its denominator is 0, like the legomena of a window without a word that occurs once).
+    """
+    if not sentences:
+        return [], []
+
+    # Chunk sentences come from a different sentence splitter, map them on the nearest sentence.
+    sentence_chunks = [ [] for _ in sentences ]
+    for j in xrange(len(chunks)):
+        sentence_chunks[j * len(sentences) / len(chunks)].append(chunks[j])
+
+    offsets = [0]
+    for s in sentences:
+        offsets.append(offsets[-1] + len(s))
+
+    accumulator = Feature_Accumulator()
+    state = {'chunk_count': 0, 'chunk_joins': 0}
+
+    # The first and last two letters of a sentence in the letter stream (every word followed by a space),
+    #   empty sentences and empty words included
+    def tail(words):
+        letters = (None, None) + tuple("".join([ w + " " for w in words[-2:] ]).lower())
+        return letters[-2:]
+
+    def head(words):
+        return "".join([ w + " " for w in words[:2] ])[:2]
+
+    def join(previous, following, sign):
+        # The character and tag n-grams that cross from one sentence into the next
+        accumulator.add_letters(head(following), tail(previous), sign, singles=False)
+        accumulator.add_letters(head(following), (None, None), -sign, singles=False)
+        if ('</s>', '<s>') in accumulator.tag_bi_dist:
+            accumulator.tag_bi_dist[('</s>', '<s>')] += sign
+
+    def update(i, sign):
+        s = sentences[i]
+        accumulator.sentence_lengths[len(s)] += sign
+        accumulator.add_words(s, sign)
+        accumulator.add_letters(chain.from_iterable(w + " " for w in s), (None, None), sign)
+        accumulator.add_sequence(tags[i], accumulator.tag_dist, accumulator.tag_bi_dist, None, sign)
+        for cs in sentence_chunks[i]:
+            accumulator.add_sequence(cs, accumulator.chunk_dist, accumulator.chunk_bi_dist, None, sign)
+        state['chunk_count'] += sign * len(sentence_chunks[i])
+
+        # Chunk sentences only join on the boundary markers
+        joins = max(0, state['chunk_count'] - 1)
+        if ('</s>', '<s>') in accumulator.chunk_bi_dist:
+            accumulator.chunk_bi_dist[('</s>', '<s>')] += joins - state['chunk_joins']
+        state['chunk_joins'] = joins
+
+    starts = []
+    windows = []
+    first, last = 0, 0      # The window holds sentences[first:last]
+    for start in xrange(0, max(1, offsets[-1] - size + 1), stride):
+        while first < last and offsets[first] < start:
+            if first + 1 < last:
+                join(sentences[first], sentences[first + 1], -1)
+            update(first, -1)
+            first += 1
+        if first == last:
+            while last < len(sentences) and offsets[last] < start:
+                last += 1
+            first = last
+        while last < len(sentences) and offsets[last + 1] <= start + size:
+            update(last, 1)
+            if first < last:
+                join(sentences[last - 1], sentences[last], 1)
+            last += 1
+        if first < last:
+            try:
+                features = accumulator.get_features(exact=False)
+            except ZeroDivisionError:
+                continue
+            starts.append(start)
+            windows.append(features)
+
+    return starts, windows
+
+
 def create_cached_features(data, filename="Cached_Features.py"):
     """
        Extract features from _data_ and store the features under _filename_ in similar structure
@@ -251,7 +565,11 @@ def demo(data):
 
 
 def load_blogs():
+    """
+        Loads the raw blog archives, shelves or block containers of them (see block_store.convert_shelve)
+    """
     import shelve, os
+    from block_store import is_block_file, Block_Reader
     print "Loading blog entries..."
     rawbdir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../rawb/")
     rawbdir = "/Users/remi/Desktop/rawb/"
@@ -260,22 +578,45 @@ def load_blogs():
     for name in names:
         f = rawbdir + name
         print f
-        sh = shelve.open(rawbdir + name)
+        if is_block_file(f):
+            sh = Block_Reader(f)
+        else:
+            sh = shelve.open(f)
         data.update(dict(sh.items()))
         sh.close()
     return data
 
 
-def create_cached_features_blog(data):
+def create_cached_features_blog(data, manifest="../../cached_blogs_manifest.log", retry_failed=False):
+    """
+        Caches the features of the blogs. Every finished author is synced to disk and recorded in _manifest_,
+            so an interrupted run continues with the authors that are not done yet.
+        Authors that failed are only tried again with _retry_failed_, as in create_Datasets.create_cached_dataset_blogs.
+    """
     import shelve, os
+    from job_manifest import Job_Manifest, Progress, DONE, FAILED
     print "Caching blog features..."
-    blogs = shelve.open(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../../cached_blogs.shelve"))
-    for author, (info, texts) in data.items():
-        print author, info
-        texts = map(lambda x : get_features(*x), texts)
+    here = os.path.dirname(os.path.realpath(__file__))
+    blogs = shelve.open(os.path.join(here, "../../cached_blogs.shelve"))
+    jobs = Job_Manifest(os.path.join(here, manifest), data.keys())
+    todo = jobs.todo(retry_failed)
+    print "\t", len(data) - len(todo), "of", len(data), "authors already handled", jobs.counts()
+    progress = Progress(len(todo), every=10)
+    for author in todo:
+        info, texts = data[author]
+        try:
+            texts = map(lambda x : get_features(*x), texts)
+        except Exception as e:
+            jobs.mark(author, FAILED, repr(e))
+            progress.step(author)
+            continue
         blogs[author] = (info, texts)
+        blogs.sync()
+        jobs.mark(author, DONE)
+        progress.step(author)
     blogs.close()
-    print "Done!"
+    jobs.close()
+    print "Done!", jobs.counts()
 
 
 
@@ -0,0 +1,288 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os, json, marshal
+from collections import OrderedDict
+from itertools import chain
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+CACHED_FEATURES = os.path.join(HERE, "Cached_Features.py")
+# The cached features in order of preference: the block container (see compress_features),
+#   the python literal, and the marshal copy load_feature_file keeps of it
+CACHED_FEATURE_FILES = [os.path.join(HERE, "Cached_Features.blkz"), CACHED_FEATURES, os.path.join(HERE, "Cached_Features.marshal")]
+# The preprocessed documents, as written by create_Datasets.create_cached_dataset (in any format), see cached_documents
+CACHED_DOCUMENTS = [os.path.join(HERE, "Dataset.blkz"), os.path.join(HERE, "Dataset.cdoc"), os.path.join(HERE, "Dataset.py")]
+
+# Registry of feature groups: name -> (version, function).
+# The function gets a preprocessed document (words, sentences, tags, chunks)
+#   and returns a list of (feature name, vector) pairs.
+# The 'base' group are the features of feature_extraction.get_features, stored in the cached feature file itself.
+# Every other group is stored in a file of its own next to it (see update_features),
+#   and load_features appends its features to those of the base group.
+# Bump the version of a group whenever its function changes, update_features then recomputes only that group.
+BASE = 'base'
+GROUPS = OrderedDict()
+
+
+def register_group(name, version, function):
+    GROUPS[name] = (version, function)
+
+
+def base_features(words, sentences, tags, chunks):
+    from feature_extraction import get_features
+    return get_features(words, sentences, tags, chunks)
+
+register_group(BASE, 1, base_features)
+
+
+def cached_features():
+    """
+        The cached feature file to read: the first of CACHED_FEATURE_FILES that exists,
+            except a container older than the python literal (made before the features were recomputed).
+        CACHED_FEATURES when there is none yet.
+    """
+    existing = [ f for f in CACHED_FEATURE_FILES if os.path.exists(f) ]
+    if not existing:
+        return CACHED_FEATURES
+    if existing[0] != CACHED_FEATURES and os.path.exists(CACHED_FEATURES) and os.path.getmtime(CACHED_FEATURES) > os.path.getmtime(existing[0]):
+        return CACHED_FEATURES
+    return existing[0]
+
+
+def cached_documents():
+    """
+        The cached preprocessed documents to read: the newest of CACHED_DOCUMENTS that exists,
+            so documents written by a new run of create_cached_dataset (in any format) are never shadowed by older ones.
+        With equal times the order of CACHED_DOCUMENTS decides.
+    """
+    existing = [ f for f in CACHED_DOCUMENTS if os.path.exists(f) ]
+    assert existing, "No cached documents, run create_Datasets.create_cached_dataset"
+    return max(existing, key=lambda f : (os.path.getmtime(f), -existing.index(f)))
+
+
+def load_features(filename=None, groups=True):
+    """
+        Loads the data of a cached feature file (by default see cached_features),
+            with the features of the other stored groups appended.
+        Groups whose stored version differs from the registered one are left out, see update_features.
+    """
+    if filename is None:
+        filename = cached_features()
+    data = load_feature_file(filename)
+    if groups:
+        stored = stored_groups(filename)
+        for name, (version, _) in GROUPS.items():
+            if name == BASE or name not in stored:
+                continue
+            if stored[name]['version'] != version:
+                print "Feature group", name, "is outdated, run feature_store.update_features"
+                continue
+            append_group(data, load_group(filename, name), stored[name]['features'])
+    return data
+
+
+def load_feature_file(filename=None):
+    """
+        Loads the data of a cached feature file, as written by feature_extraction.create_cached_features.
+        Importing that file means evaluating one giant literal, which takes seconds.
+        So a marshal copy is kept next to it, which loads many times faster.
+        The copy is made on the first load, and again whenever the feature file is newer.
+        A block container (see compress_features) is read directly.
+    """
+    if filename is None:
+        filename = cached_features()
+    from block_store import is_block_file, read_nested
+    if is_block_file(filename):
+        return read_nested(filename)
+
+    fast = os.path.splitext(filename)[0] + ".marshal"
+    if os.path.exists(fast) and os.path.getmtime(fast) >= os.path.getmtime(filename):
+        f = open(fast, 'rb')
+        data = marshal.load(f)
+        f.close()
+        return data
+
+    namespace = dict()
+    execfile(filename, namespace)
+    data = namespace['data']
+
+    try:
+        f = open(fast + ".tmp", 'wb')
+        marshal.dump(data, f)
+        f.close()
+        os.rename(fast + ".tmp", fast)
+    except (IOError, OSError):
+        pass    # Read-only location, just load the slow way next time
+    return data
+
+
+def group_path(filename, name):
+    """
+        Groups are stored by the name of the cached feature file without extension,
+            so the python literal, its marshal copy and a container of it share them
+    """
+    return os.path.splitext(filename)[0] + "." + name + ".marshal"
+
+
+def groups_path(filename):
+    return os.path.splitext(filename)[0] + ".groups.json"
+
+
+def stored_groups(filename=None):
+    """
+        {group: {'version': v, 'features': [names]}} of the groups stored with _filename_
+    """
+    if filename is None:
+        filename = cached_features()
+    path = groups_path(filename)
+    if not os.path.exists(path):
+        # Feature files from before the registry only have the base group
+        return {BASE: {'version': 1, 'features': []}} if os.path.exists(filename) else dict()
+    f = open(path)
+    stored = json.load(f)
+    f.close()
+    return stored
+
+
+def write_stored_groups(filename, stored):
+    path = groups_path(filename)
+    f = open(path + ".tmp", 'w')
+    json.dump(stored, f, indent=1, sort_keys=True)
+    f.close()
+    os.rename(path + ".tmp", path)
+
+
+def load_group(filename, name):
+    f = open(group_path(filename, name), 'rb')
+    group = marshal.load(f)
+    f.close()
+    return group
+
+
+def append_group(data, group, names):
+    """
+        Appends the vectors of one group ({author: {story: [vector per name]}}) to the features of _data_
+    """
+    for author, stories in group.items():
+        for story, vectors in stories.items():
+            if author not in data or story not in data[author]:
+                continue
+            features, feature_dic = data[author][story]
+            feature_dic = dict(feature_dic)
+            for name, vector in zip(names, vectors):
+                feature_dic[name] = vector
+            data[author][story] = (features + tuple(chain(*vectors)), feature_dic)
+
+
+def iter_documents(filename=None):
+    """
+        Yields (author, story, (words, sentences, tags, chunks)) of the cached preprocessed documents
+    """
+    if filename is None:
+        filename = cached_documents()
+
+    from block_store import is_block_file, Block_Reader
+    if is_block_file(filename):
+        reader = Block_Reader(filename)
+        for (author, story), document in reader.items():
+            yield author, story, document
+        reader.close()
+    elif filename.endswith(".cdoc"):
+        from compact_documents import load_dataset
+        vocabulary, documents = load_dataset(filename)
+        for author in sorted(documents.keys()):
+            for story in sorted(documents[author].keys()):
+                yield author, story, documents[author][story].unpack(vocabulary)
+    else:
+        namespace = dict()
+        execfile(filename, namespace)
+        documents = namespace['data']
+        for author in sorted(documents.keys()):
+            for story in sorted(documents[author].keys()):
+                yield author, story, documents[author][story]
+
+
+def update_features(filename=None, documents=None):
+    """
+        Computes the feature groups that are missing or outdated in _filename_ (by default see cached_features),
+            from the cached preprocessed documents.
+        Every other group is kept as it is: a new or changed group only writes its own file.
+        Only an outdated base group rewrites the cached feature file (in its own format).
+        Returns the names of the updated groups.
+    """
+    from block_store import write_nested
+    if filename is None:
+        filename = cached_features()
+    if filename.endswith(".marshal"):
+        filename = os.path.splitext(filename)[0] + ".py"     # The copy is remade from the literal
+    stored = stored_groups(filename)
+    todo = [ name for name, (version, _) in GROUPS.items() if stored.get(name, {}).get('version') != version ]
+    if not todo:
+        return []
+    print "Computing feature groups:", ", ".join(todo)
+
+    results = dict([ (name, dict()) for name in todo ])
+    names = dict([ (name, []) for name in todo ])
+    for author, story, document in iter_documents(documents):
+        for name in todo:
+            if name == BASE:
+                results[name].setdefault(author, dict())[story] = base_features(*document)
+            else:
+                pairs = GROUPS[name][1](*document)
+                names[name] = [ n for n, _ in pairs ]
+                results[name].setdefault(author, dict())[story] = [ tuple(v) for _, v in pairs ]
+
+    for name in todo:
+        if name == BASE and filename.endswith(".blkz"):
+            write_nested(filename, results[name])
+        elif name == BASE:
+            f = open(filename + ".tmp", 'w')
+            f.write("# -*- coding: utf-8 -*-\n")
+            f.write("data = " + str(results[name]) + "\n")
+            f.close()
+            os.rename(filename + ".tmp", filename)
+        else:
+            path = group_path(filename, name)
+            f = open(path + ".tmp", 'wb')
+            marshal.dump(results[name], f)
+            f.close()
+            os.rename(path + ".tmp", path)
+        # Recorded after each group is written, so an interrupted update keeps the groups that are done
+        stored[name] = {'version': GROUPS[name][0], 'features': names[name]}
+        write_stored_groups(filename, stored)
+    return todo
+
+
+def compress_features(filename=None, output=None, codec='zlib'):
+    """
+        Copies a cached feature file into a block container (by default next to it, as .blkz),
+            load_features reads either and prefers the container. The python literal can be removed afterwards.
+        The stored groups go along when the container gets another name. Returns the name of the container.
+    """
+    import shutil
+    from block_store import write_nested
+    if filename is None:
+        filename = cached_features()
+    if output is None:
+        output = os.path.splitext(filename)[0] + ".blkz"
+    write_nested(output, load_feature_file(filename), codec=codec)
+
+    if os.path.splitext(output)[0] != os.path.splitext(filename)[0] and os.path.exists(groups_path(filename)):
+        stored = stored_groups(filename)
+        for name in stored:
+            if name != BASE:
+                shutil.copyfile(group_path(filename, name), group_path(output, name))
+        write_stored_groups(output, stored)
+    return output
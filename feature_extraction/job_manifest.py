@@ -0,0 +1,100 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os, json
+from time import time
+
+PENDING = 'pending'
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+class Job_Manifest:
+    """
+        Keeps the status of every item of a long batch job, so an interrupted job can be resumed.
+        The status changes are appended to a log file, one JSON line each, and synced to disk right away.
+        An item is only marked done after its output is completely written,
+            so at worst the item that was being worked on is done again.
+    """
+    def __init__(self, filename, items):
+        self.filename = filename
+        self.status = dict([ (item, PENDING) for item in items ])
+        self.info = dict()
+        if os.path.exists(filename):
+            f = open(filename)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue    # A line cut off by a crash
+                if entry['item'] in self.status:
+                    self.status[entry['item']] = entry['status']
+                    self.info[entry['item']] = entry.get('info')
+            f.close()
+        self.log = open(filename, 'a')
+        if self.log.tell() > 0:
+            # Start on a fresh line, in case the last one was cut off
+            self.log.write("\n")
+
+    def todo(self, retry_failed=False):
+        """
+            The items that still have to be done, in sorted order
+        """
+        statuses = [PENDING, FAILED] if retry_failed else [PENDING]
+        return sorted([ item for item, status in self.status.items() if status in statuses ])
+
+    def mark(self, item, status, info=None):
+        self.status[item] = status
+        self.info[item] = info
+        self.log.write(json.dumps({'item': item, 'status': status, 'info': info, 'time': time()}) + "\n")
+        self.log.flush()
+        os.fsync(self.log.fileno())
+
+    def counts(self):
+        counts = dict([ (s, 0) for s in [PENDING, DONE, SKIPPED, FAILED] ])
+        for status in self.status.values():
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def close(self):
+        self.log.close()
+
+
+class Progress:
+    """
+        Prints the progress of a job with its throughput and expected time left.
+    """
+    def __init__(self, total, every=100):
+        self.total = total
+        self.every = every
+        self.done = 0
+        self.start = time()
+
+    def step(self, name=""):
+        self.done += 1
+        if self.done % self.every == 0 or self.done == self.total:
+            print "\t" + self.line(), name
+
+    def line(self):
+        elapsed = time() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        left = (self.total - self.done) / rate if rate > 0 else 0.0
+        return "%d/%d  %.2f items/s  elapsed %s  ETA %s" % (self.done, self.total, rate, clock(elapsed), clock(left))
+
+
+def clock(seconds):
+    seconds = int(seconds)
+    return "%d:%02d:%02d" % (seconds / 3600, seconds / 60 % 60, seconds % 60)
@@ -0,0 +1,166 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+    Lightweight instrumentation of the pipeline stages.
+    Records wall time, cpu time, number of calls and memory per stage.
+    The memory of a stage is how far it raised the peak resident memory of the process (the largest rise of any call).
+        A stage that stays below an earlier peak shows no rise, so this is a lower bound of what the stage used;
+        stages that run first, or in a process of their own, are measured exactly.
+    The peak of the whole process at the end of the stage is recorded as well.
+
+    Switched off by default. Switch on with the environment variable STYLOMETRY_PROFILE=1,
+        or by calling enable(). When STYLOMETRY_PROFILE_OUTPUT is set as well,
+        a JSON summary is written to that file when the program exits.
+
+    Usage:
+        with stage("pos_tag"):
+            ...
+    or
+        @profiled("fit")
+        def fit(...):
+            ...
+"""
+
+import os, json, atexit, resource
+from time import time
+from functools import wraps
+
+ENABLED = os.environ.get("STYLOMETRY_PROFILE", "0") not in ("", "0")
+
+records = dict()
+
+
+def enable(flag=True):
+    """
+        Switch the instrumentation on (or off with _flag_ False)
+    """
+    global ENABLED
+    ENABLED = flag
+
+
+def reset():
+    records.clear()
+
+
+def cpu_time():
+    user, system = os.times()[:2]
+    return user + system
+
+
+def peak_memory():
+    # Peak resident memory of this process, in kilobytes on Linux (bytes on OS X)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Stage(object):
+    """
+        Context manager that adds the time spent inside it to the record of _name_.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time()
+        self.cpu = cpu_time()
+        self.peak = peak_memory()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time() - self.wall
+        cpu = cpu_time() - self.cpu
+        record = records.get(self.name)
+        if record is None:
+            record = records[self.name] = {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_memory_rise': 0, 'process_peak_memory': 0}
+        peak = peak_memory()
+        record['calls'] += 1
+        record['wall'] += wall
+        record['cpu'] += cpu
+        record['peak_memory_rise'] = max(record['peak_memory_rise'], peak - self.peak)
+        record['process_peak_memory'] = max(record['process_peak_memory'], peak)
+        return False
+
+
+class Null_Stage(object):
+    """
+        Does nothing, used while the instrumentation is switched off.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_STAGE = Null_Stage()
+
+
+def stage(name):
+    """
+        Returns a context manager that times the stage _name_, if the instrumentation is on.
+    """
+    if ENABLED:
+        return Stage(name)
+    return NULL_STAGE
+
+
+def profiled(name):
+    """
+        Decorator that times every call of the function as stage _name_.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with Stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summary():
+    """
+        Returns the records, with the average time per call added.
+    """
+    result = dict()
+    for name, record in records.items():
+        record = dict(record)
+        record['wall_per_call'] = record['wall'] / record['calls']
+        record['cpu_per_call'] = record['cpu'] / record['calls']
+        result[name] = record
+    return result
+
+
+def dump(filename):
+    """
+        Writes the summary as JSON to _filename_
+    """
+    f = open(filename, 'w')
+    json.dump(summary(), f, indent=1, sort_keys=True)
+    f.close()
+
+
+def report():
+    """
+        Prints the summary, slowest stage first
+    """
+    stages = sorted(summary().items(), key=lambda x : x[1]['wall'], reverse=True)
+    print "%-32s %8s %10s %10s %14s %14s" % ("stage", "calls", "wall (s)", "cpu (s)", "peak rise", "process peak")
+    for name, r in stages:
+        print "%-32s %8d %10.3f %10.3f %14d %14d" % (name, r['calls'], r['wall'], r['cpu'], r['peak_memory_rise'], r['process_peak_memory'])
+
+
+if os.environ.get("STYLOMETRY_PROFILE_OUTPUT"):
+    atexit.register(lambda : records and dump(os.environ["STYLOMETRY_PROFILE_OUTPUT"]))
@@ -0,0 +1,84 @@
+"""
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import OrderedDict
+
+
+class Sentence_Cache:
+    """
+        Bounded least-recently-used cache of the nlp results of single sentences.
+        Blogs repeat a lot of sentences (signatures, quotes, "urlLink" lines),
+            with this cache each of them is tagged once instead of every time it occurs.
+        Keys are (kind, sentence) pairs, for example ("tags", u"Hello world .").
+        With _filename_ the results are also kept in a shelve, so they survive between runs.
+    """
+    def __init__(self, maxsize=50000, filename=None):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.persistent_hits = 0
+        self.store = None
+        if filename is not None:
+            import shelve
+            self.store = shelve.open(filename)
+
+    def get(self, kind, sentence, compute):
+        """
+            Returns the cached result for _sentence_, or caches and returns compute(sentence)
+        """
+        key = (kind, sentence)
+        value = self.items.pop(key, None)
+        if value is not None:
+            self.hits += 1
+            self.items[key] = value     # Now the most recently used
+            return value
+
+        store_key = None
+        if self.store is not None:
+            store_key = (kind + "\t" + sentence).encode("utf8")
+            if store_key in self.store:
+                value = self.store[store_key]
+                self.persistent_hits += 1
+
+        if value is None:
+            self.misses += 1
+            value = compute(sentence)
+            if store_key is not None:
+                self.store[store_key] = value
+
+        self.items[key] = value
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            'hits': self.hits,
+            'persistent_hits': self.persistent_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.persistent_hits) / float(lookups) if lookups else 0.0,
+            'size': len(self.items),
+        }
+
+    def clear(self):
+        self.items.clear()
+        self.hits = self.misses = self.persistent_hits = 0
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None